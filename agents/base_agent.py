@@ -5,6 +5,8 @@ from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional, Callable
 import asyncio
 import logging
+import os
+import threading
 from shared.protocols import A2AMessage, A2ARequest, A2AResponse, MessageType
 from shared.message_queue import message_queue
 
@@ -12,9 +14,19 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class A2AError(Exception):
+    """Raised to the sender when an agent replies with success=False"""
+
+
 class BaseAgent(ABC):
     """Abstract base class for agents"""
     
+    # Max handlers running at once; excess messages wait instead of piling onto
+    # downstream services. Subclasses calling slow external APIs set a lower value.
+    # To tune: raise it until handler latency or downstream errors start climbing,
+    # then back off by ~25%.
+    max_inflight: Optional[int] = None
+    
     def __init__(self, agent_id: str, agent_type: str, capabilities: list):
         self.agent_id = agent_id
         self.agent_type = agent_type
@@ -22,6 +34,10 @@ class BaseAgent(ABC):
         self.status = "idle"
         self.current_task = None
         self.message_handlers: Dict[str, Callable] = {}
+        self.pending_responses: Dict[str, asyncio.Future] = {}  # message_id -> reply future
+        self._loop: Optional[asyncio.AbstractEventLoop] = None  # started by start_listening
+        self._listener: Optional[threading.Thread] = None  # started by start_listening_in_background
+        self._sem = asyncio.Semaphore(self.max_inflight or int(os.getenv("AGENT_MAX_INFLIGHT", "32")))
         
         # Register default handlers
         self._register_handlers()
@@ -38,8 +54,8 @@ class BaseAgent(ABC):
         self.message_handlers[action] = handler
         logger.info(f"  Registered handler: {action}")
     
-    async def send_message(self, to_agent: str, action: str, parameters: Dict[str, Any], context: Optional[Dict[str, Any]] = None):
-        """Send an A2A message to another agent"""
+    async def send_message(self, to_agent: str, action: str, parameters: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> asyncio.Future:
+        """Send an A2A message to another agent; returns a future resolved with the reply's result"""
         request = A2ARequest(
             from_agent=self.agent_id,
             to_agent=to_agent,
@@ -49,56 +65,106 @@ class BaseAgent(ABC):
             payload={"action": action, "parameters": parameters}
         )
         
-        logger.info(f"→ {self.agent_id} sending {action} to {to_agent}")
+        logger.info("→ %s sending %s to %s", self.agent_id, action, to_agent)
+        
+        # Register the reply future before publishing so a fast reply can't be missed
+        future = asyncio.get_running_loop().create_future()
+        self.pending_responses[request.message_id] = future
+        future.add_done_callback(lambda _: self.pending_responses.pop(request.message_id, None))
         
         # Publish to message queue
         queue_name = f"agent_{to_agent}"
         message_queue.declare_queue(queue_name)
         message_queue.publish(queue_name, request)
         
-        return request.message_id
+        return future
     
     async def handle_message(self, message: A2AMessage):
         """Handle incoming A2A message"""
         try:
             if message.message_type == MessageType.REQUEST:
-                request = A2ARequest(**message.model_dump())
+                # Messages from the queue are already parsed as A2ARequest
+                if isinstance(message, A2ARequest):
+                    request = message
+                else:
+                    request = A2ARequest.model_validate(message, from_attributes=True)
                 action = request.payload.get("action")
                 
-                logger.info(f"← {self.agent_id} received {action} from {request.from_agent}")
+                logger.info("← %s received %s from %s", self.agent_id, action, request.from_agent)
                 
-                if action in self.message_handlers:
-                    self.status = "busy"
-                    self.current_task = {"action": action, "message_id": request.message_id}
-                    
-                    # Execute handler
-                    result = await self.message_handlers[action](request.payload.get("parameters", {}), request.context)
-                    
-                    # Send response
-                    response = A2AResponse(
-                        from_agent=self.agent_id,
-                        to_agent=request.from_agent,
-                        conversation_id=request.conversation_id,
-                        success=True,
-                        result=result,
-                        payload={"result": result}
-                    )
-                    
-                    queue_name = f"agent_{request.from_agent}"
-                    message_queue.declare_queue(queue_name)
-                    message_queue.publish(queue_name, response)
-                    
+                handler = self.message_handlers.get(action)
+                if handler is None:
+                    logger.warning("No handler for action: %s", action)
+                    self._reply(request, success=False, error=f"{self.agent_id} has no handler for action: {action}")
+                    return
+                
+                self.status = "busy"
+                self.current_task = {"action": action, "message_id": request.message_id}
+                
+                # Execute handler; failures are replied too so the sender doesn't wait out its timeout
+                try:
+                    async with self._sem:
+                        result = await handler(request.payload.get("parameters", {}), request.context)
+                except Exception as e:
+                    logger.exception("%s failed handling %s", self.agent_id, action)
+                    self._reply(request, success=False, error=str(e) or type(e).__name__)
+                    return
+                finally:
                     self.status = "idle"
                     self.current_task = None
-                    
-                    logger.info(f"✓ {self.agent_id} completed {action}")
-                else:
-                    logger.warning(f"No handler for action: {action}")
+                
+                self._reply(request, success=True, result=result)
+                
+                logger.info("✓ %s completed %s", self.agent_id, action)
+            
+            elif message.message_type == MessageType.RESPONSE:
+                future = self.pending_responses.pop(message.in_reply_to, None)
+                if future is not None:
+                    # Replies may arrive on the consumer thread, so resolve on the future's own loop
+                    future.get_loop().call_soon_threadsafe(self._resolve_response, future, message)
                     
         except Exception as e:
-            logger.error(f"Error handling message: {e}")
+            logger.error("Error handling message: %s", e)
             self.status = "error"
     
+    def _reply(self, request: A2ARequest, success: bool, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        """Send the A2A response for a request back to its sender"""
+        response = A2AResponse(
+            from_agent=self.agent_id,
+            to_agent=request.from_agent,
+            conversation_id=request.conversation_id,
+            in_reply_to=request.message_id,
+            success=success,
+            result=result,
+            error=error,
+            payload={"result": result} if success else {"error": error}
+        )
+        
+        queue_name = f"agent_{request.from_agent}"
+        message_queue.declare_queue(queue_name)
+        message_queue.publish(queue_name, response)
+    
+    @staticmethod
+    def _resolve_response(future: asyncio.Future, response: A2AMessage):
+        """Resolve a pending reply future unless it already timed out; failed replies raise A2AError"""
+        if future.done():
+            return
+        if getattr(response, "success", True):
+            future.set_result(response.payload.get("result"))
+        else:
+            future.set_exception(A2AError(response.error or response.payload.get("error") or "request failed"))
+    
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the agent's long-lived event loop on a background thread"""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=self._loop.run_forever,
+                name=f"{self.agent_id}-loop",
+                daemon=True
+            ).start()
+        return self._loop
+    
     def start_listening(self):
         """Start listening for messages"""
         queue_name = f"agent_{self.agent_id}"
@@ -106,7 +172,15 @@ class BaseAgent(ABC):
         
         logger.info(f"👂 {self.agent_id} listening on queue: {queue_name}")
         
-        message_queue.consume(queue_name, lambda msg: asyncio.run(self.handle_message(msg)))
+        # Hand each message to the persistent loop instead of spinning up a loop per message
+        loop = self._ensure_loop()
+        message_queue.consume(queue_name, lambda msg: asyncio.run_coroutine_threadsafe(self.handle_message(msg), loop))
+    
+    def start_listening_in_background(self):
+        """Consume the agent's queue on a daemon thread (once per process)"""
+        if self._listener is None:
+            self._listener = threading.Thread(target=self.start_listening, name=f"{self.agent_id}-consumer", daemon=True)
+            self._listener.start()
     
     def get_status(self) -> Dict[str, Any]:
         """Get agent status"""
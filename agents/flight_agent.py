@@ -1,10 +1,65 @@
 """
 Flight Booking Agent
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+import functools
+import asyncio
+import hashlib
+import orjson
+import logging
 from .base_agent import BaseAgent
 from mcp_servers.flight_server import flight_server
 from shared.protocols import MCPToolCall
+from shared.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Searches arriving within this window (seconds) share one MCP round trip
+SEARCH_BATCH_WINDOW = 0.005
+SEARCH_BATCH_MAX = 32
+
+
+# Cached result lifetimes (seconds)
+SEARCH_CACHE_TTL = 300
+DETAILS_CACHE_TTL = 3600
+
+
+def cache_key(namespace: str, parameters: Dict[str, Any]) -> str:
+    """Redis key for a handler result, keyed by a hash of its parameters"""
+    digest = hashlib.sha256(orjson.dumps(parameters, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)).hexdigest()
+    return f"flight:{namespace}:{digest}"
+
+
+def cached(namespace: str, ttl: int):
+    """Cache a handler's successful result in Redis, keyed by a hash of its parameters"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(self, parameters: Dict[str, Any], context: Optional[Dict[str, Any]] = None):
+            key = cache_key(namespace, parameters)
+            
+            try:
+                hit = redis_client.get(key)
+            except Exception as e:
+                # Redis unavailable - degrade to calling the MCP server directly
+                logger.warning(f"Flight cache unavailable: {e}")
+                return await handler(self, parameters, context)
+            
+            if hit is not None:
+                self.cache_hits += 1
+                return hit
+            
+            self.cache_misses += 1
+            result = await handler(self, parameters, context)
+            
+            if "error" not in result:
+                try:
+                    redis_client.set(key, result, ttl=ttl)
+                except Exception as e:
+                    logger.warning(f"Failed to cache {namespace} result: {e}")
+            
+            return result
+        return wrapper
+    return decorator
 
 
 class FlightAgent(BaseAgent):
@@ -17,6 +72,10 @@ class FlightAgent(BaseAgent):
             capabilities=["search_flights", "book_flight", "get_flight_details"]
         )
         self.mcp_server = flight_server
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._search_queue: Optional[asyncio.Queue] = None
+        self._batcher_task: Optional[asyncio.Task] = None
     
     def _register_handlers(self):
         """Register flight-specific handlers"""
@@ -24,15 +83,20 @@ class FlightAgent(BaseAgent):
         self.register_handler("book_flight", self.book_flight)
         self.register_handler("get_flight_details", self.get_flight_details)
     
+    @cached("search", ttl=SEARCH_CACHE_TTL)
     async def search_flights(self, parameters: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Search for flights"""
+        return await self._search_flights(parameters, context)
+    
+    async def _search_flights(self, parameters: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Search for flights through the MCP server, bypassing the cache"""
         tool_call = MCPToolCall(
             tool_name="search_flights",
             arguments=parameters,
             context=context
         )
         
-        result = await self.mcp_server.handle_tool_call(tool_call)
+        result = await self._submit_search(tool_call)
         
         if result.success:
             return {
@@ -45,6 +109,77 @@ class FlightAgent(BaseAgent):
                 "flights": []
             }
     
+    async def search_flights_batch(self, parameter_list: List[Dict[str, Any]], context: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Search several routes at once (e.g. multi-city or round trips)
+        
+        Cache lookups and writes for the whole batch take one Redis round trip each.
+        """
+        keys = [cache_key("search", parameters) for parameters in parameter_list]
+        try:
+            results = redis_client.mget(keys)
+        except Exception as e:
+            logger.warning(f"Flight cache unavailable: {e}")
+            results = [None] * len(keys)
+        
+        misses = [i for i, result in enumerate(results) if result is None]
+        self.cache_hits += len(results) - len(misses)
+        self.cache_misses += len(misses)
+        
+        fresh = await asyncio.gather(*[self._search_flights(parameter_list[i], context) for i in misses])
+        to_cache = {}
+        for i, result in zip(misses, fresh):
+            results[i] = result
+            if "error" not in result:
+                to_cache[keys[i]] = result
+        
+        if to_cache:
+            try:
+                redis_client.mset(to_cache, ttl=SEARCH_CACHE_TTL)
+            except Exception as e:
+                logger.warning(f"Failed to cache search results: {e}")
+        
+        return results
+    
+    async def _submit_search(self, tool_call: MCPToolCall):
+        """Run a search tool call, coalescing calls made on the agent's own loop.
+        
+        Only the long-lived agent loop (A2A requests) batches, so the queue and
+        batcher are only ever touched from its thread. Flask async views each
+        run a short-lived loop with nothing to coalesce, so they call the MCP
+        server directly instead of paying the batch window.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            return await self.mcp_server.handle_tool_call(tool_call)
+        
+        if self._batcher_task is None or self._batcher_task.done():
+            self._search_queue = asyncio.Queue()
+            self._batcher_task = loop.create_task(self._batcher(self._search_queue))
+        
+        future = loop.create_future()
+        self._search_queue.put_nowait((tool_call, future))
+        return await future
+    
+    async def _batcher(self, queue: asyncio.Queue):
+        """Coalesce queued search calls into batched MCP requests"""
+        while True:
+            batch = [await queue.get()]
+            await asyncio.sleep(SEARCH_BATCH_WINDOW)
+            while len(batch) < SEARCH_BATCH_MAX and not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            try:
+                results = await self.mcp_server.handle_tool_call_batch([call for call, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+    
     async def book_flight(self, parameters: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Book a flight"""
         tool_call = MCPToolCall(
@@ -63,6 +198,7 @@ class FlightAgent(BaseAgent):
                 "error": result.error
             }
     
+    @cached("details", ttl=DETAILS_CACHE_TTL)
     async def get_flight_details(self, parameters: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Get flight details"""
         tool_call = MCPToolCall(
@@ -79,7 +215,18 @@ class FlightAgent(BaseAgent):
             return {
                 "error": result.error
             }
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get agent status including result cache counters"""
+        status = super().get_status()
+        status["cache"] = {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses
+        }
+        return status
 
 
-# Global instance
-flight_agent = FlightAgent()
+@functools.cache
+def get_flight_agent() -> FlightAgent:
+    """Get the process-wide FlightAgent, created on first use"""
+    return FlightAgent()
@@ -2,36 +2,43 @@
 Orchestrator Agent - Coordinates multi-step workflows
 """
 from typing import Dict, Any, List, Optional
+import functools
 import asyncio
+import time
 import uuid
-from datetime import datetime
-from .base_agent import BaseAgent
+from dataclasses import dataclass, field
+from .base_agent import A2AError, BaseAgent
 from shared.redis_client import redis_client
 from shared.database import get_session, Booking, User
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Seconds to wait for an agent to reply to a workflow step
+STEP_TIMEOUT = 30
 
+
+@dataclass(slots=True)
 class WorkflowStep:
     """Represents a step in a workflow"""
-    def __init__(self, agent_id: str, action: str, parameters: Dict[str, Any]):
-        self.agent_id = agent_id
-        self.action = action
-        self.parameters = parameters
-        self.result = None
-        self.status = "pending"  # pending, completed, failed
+    agent_id: str
+    action: str
+    parameters: Dict[str, Any]
+    depends_on: List[int] = field(default_factory=list)  # indices of steps that must complete first
+    result: Optional[Dict[str, Any]] = None
+    status: str = "pending"  # pending, completed, failed
 
 
+@dataclass(slots=True)
 class Workflow:
     """Represents a multi-step workflow"""
-    def __init__(self, workflow_id: str, workflow_type: str):
-        self.workflow_id = workflow_id
-        self.workflow_type = workflow_type
-        self.steps: List[WorkflowStep] = []
-        self.status = "pending"
-        self.created_at = datetime.utcnow()
-        self.completed_steps = []
+    workflow_id: str
+    workflow_type: str
+    steps: List[WorkflowStep] = field(default_factory=list)
+    status: str = "pending"
+    created_at_ns: int = field(default_factory=time.time_ns)
+    completed_steps: List[WorkflowStep] = field(default_factory=list)
+    _next_pending: int = field(default=0, init=False, repr=False)  # no step before this index is pending
     
     def add_step(self, step: WorkflowStep):
         """Add a step to the workflow"""
@@ -39,10 +46,32 @@ class Workflow:
     
     def get_next_step(self) -> Optional[WorkflowStep]:
         """Get the next pending step"""
-        for step in self.steps:
-            if step.status == "pending":
-                return step
+        # Steps never return to pending, so the cursor only moves forward
+        while self._next_pending < len(self.steps) and self.steps[self._next_pending].status != "pending":
+            self._next_pending += 1
+        if self._next_pending < len(self.steps):
+            return self.steps[self._next_pending]
         return None
+    
+    def get_execution_levels(self) -> List[List[int]]:
+        """Group step indices into levels; steps within a level have no dependencies on each other"""
+        remaining = {i: set(step.depends_on) for i, step in enumerate(self.steps)}
+        for i, deps in remaining.items():
+            unknown = [d for d in deps if d not in remaining or d == i]
+            if unknown:
+                raise ValueError(f"Step {i} has invalid dependencies: {unknown}")
+        
+        levels = []
+        while remaining:
+            ready = [i for i, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"Workflow {self.workflow_id} has a dependency cycle")
+            levels.append(ready)
+            for i in ready:
+                del remaining[i]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return levels
 
 
 class OrchestratorAgent(BaseAgent):
@@ -64,10 +93,10 @@ class OrchestratorAgent(BaseAgent):
     async def book_complete_trip(self, parameters: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Book a complete trip (flight + hotel + payment)"""
         try:
-            workflow_id = str(uuid.uuid4())
+            workflow_id = uuid.uuid4().hex
             workflow = Workflow(workflow_id, "complete_trip")
             
-            # Step 1: Search and select flight
+            # Step 1: Search and select flight (runs in parallel with payment)
             workflow.add_step(WorkflowStep(
                 agent_id="flight_agent",
                 action="search_flights",
@@ -94,14 +123,15 @@ class OrchestratorAgent(BaseAgent):
                 }
             ))
             
-            # Step 3: Book flight
+            # Step 3: Book flight once search and payment have both completed
             workflow.add_step(WorkflowStep(
                 agent_id="flight_agent",
                 action="book_flight",
                 parameters={
                     "flight_id": parameters.get("selected_flight_id"),
                     "passenger_details": parameters["passenger_details"]
-                }
+                },
+                depends_on=[0, 1]
             ))
             
             # Execute workflow
@@ -119,7 +149,7 @@ class OrchestratorAgent(BaseAgent):
     async def book_flight_only(self, parameters: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Book flight only workflow"""
         try:
-            workflow_id = str(uuid.uuid4())
+            workflow_id = uuid.uuid4().hex
             workflow = Workflow(workflow_id, "flight_only")
             
             # Step 1: Search flights
@@ -146,37 +176,27 @@ class OrchestratorAgent(BaseAgent):
             }
     
     async def execute_workflow(self, workflow: Workflow) -> Dict[str, Any]:
-        """Execute a workflow step by step"""
+        """Execute a workflow, running independent steps concurrently"""
         self.active_workflows[workflow.workflow_id] = workflow
         workflow.status = "executing"
         
-        logger.info(f"🚀 Executing workflow: {workflow.workflow_id} ({workflow.workflow_type})")
+        logger.info("🚀 Executing workflow: %s (%s)", workflow.workflow_id, workflow.workflow_type)
         
         try:
-            for i, step in enumerate(workflow.steps):
-                logger.info(f"  Step {i+1}/{len(workflow.steps)}: {step.action} via {step.agent_id}")
-                
-                # Send message to agent
-                message_id = await self.send_message(
-                    to_agent=step.agent_id,
-                    action=step.action,
-                    parameters=step.parameters,
-                    context={"workflow_id": workflow.workflow_id}
+            for level in workflow.get_execution_levels():
+                results = await asyncio.gather(
+                    *[self._run_step(workflow, i) for i in level],
+                    return_exceptions=True
                 )
                 
-                # Wait for response (simplified - in production use proper async waiting)
-                await asyncio.sleep(1)
-                
-                # Mock response (in production, wait for actual A2A response)
-                step.status = "completed"
-                step.result = {"success": True, "message_id": message_id}
-                workflow.completed_steps.append(step)
-                
-                logger.info(f"  ✓ Step {i+1} completed")
+                # Fail the workflow on the first error; completed siblings are rolled back
+                for result in results:
+                    if isinstance(result, Exception):
+                        raise result
             
             workflow.status = "completed"
             
-            logger.info(f"✓ Workflow completed: {workflow.workflow_id}")
+            logger.info("✓ Workflow completed: %s", workflow.workflow_id)
             
             return {
                 "success": True,
@@ -187,7 +207,7 @@ class OrchestratorAgent(BaseAgent):
             }
             
         except Exception as e:
-            logger.error(f"Workflow execution error: {e}")
+            logger.error("Workflow execution error: %s", e)
             workflow.status = "failed"
             
             # Rollback completed steps
@@ -200,6 +220,44 @@ class OrchestratorAgent(BaseAgent):
                 "rollback_completed": True
             }
     
+    async def _run_step(self, workflow: Workflow, index: int):
+        """Dispatch a single workflow step to its agent and record the result"""
+        step = workflow.steps[index]
+        logger.debug("  Step %d/%d: %s via %s", index + 1, len(workflow.steps), step.action, step.agent_id)
+        
+        try:
+            # Send message to agent and wait for its A2A response
+            result = await self._request(
+                to_agent=step.agent_id,
+                action=step.action,
+                parameters=step.parameters,
+                context={"workflow_id": workflow.workflow_id}
+            )
+        except asyncio.TimeoutError:
+            step.status = "failed"
+            raise TimeoutError(f"Step {index+1} ({step.action}) timed out after {STEP_TIMEOUT}s")
+        except A2AError as e:
+            step.status = "failed"
+            raise A2AError(f"Step {index+1} ({step.action}) failed: {e}") from e
+        except Exception:
+            step.status = "failed"
+            raise
+        
+        step.status = "completed"
+        step.result = result or {}
+        workflow.completed_steps.append(step)
+        
+        logger.debug("  ✓ Step %d completed", index + 1)
+    
+    async def _request(self, to_agent: str, action: str, parameters: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> Any:
+        """Send an A2A request and wait up to STEP_TIMEOUT for the reply.
+        
+        Raises A2AError if the agent replies with success=False. On timeout the
+        reply future is cancelled, which drops it from pending_responses.
+        """
+        response = await self.send_message(to_agent=to_agent, action=action, parameters=parameters, context=context)
+        return await asyncio.wait_for(response, timeout=STEP_TIMEOUT)
+    
     async def rollback_workflow(self, workflow: Workflow):
         """Rollback completed steps in reverse order"""
         logger.info(f"🔄 Rolling back workflow: {workflow.workflow_id}")
@@ -210,12 +268,19 @@ class OrchestratorAgent(BaseAgent):
             # Implement rollback logic based on step type
             if step.action == "process_payment":
                 # Refund payment
-                await self.send_message(
-                    to_agent="payment_agent",
-                    action="refund_payment",
-                    parameters={"payment_id": step.result.get("payment_id")},
-                    context={"workflow_id": workflow.workflow_id, "rollback": True}
-                )
+                try:
+                    refund = await self._request(
+                        to_agent="payment_agent",
+                        action="refund_payment",
+                        parameters={"payment_id": step.result.get("payment_id")},
+                        context={"workflow_id": workflow.workflow_id, "rollback": True}
+                    )
+                except asyncio.TimeoutError:
+                    logger.error("  Refund for payment %s timed out after %ss", step.result.get("payment_id"), STEP_TIMEOUT)
+                except A2AError as e:
+                    logger.error("  Refund for payment %s failed: %s", step.result.get("payment_id"), e)
+                else:
+                    logger.info("  Refund result: %s", refund)
             elif step.action == "book_flight":
                 # Cancel flight booking
                 logger.info(f"  Would cancel flight booking: {step.result}")
@@ -223,5 +288,7 @@ class OrchestratorAgent(BaseAgent):
         logger.info(f"✓ Rollback completed for workflow: {workflow.workflow_id}")
 
 
-# Global instance
-orchestrator = OrchestratorAgent()
+@functools.cache
+def get_orchestrator() -> OrchestratorAgent:
+    """Get the process-wide OrchestratorAgent, created on first use"""
+    return OrchestratorAgent()
@@ -2,19 +2,35 @@
 Payment Agent with AP2 Protocol
 """
 from typing import Dict, Any, Optional
+import functools
+import time
 import uuid
-from datetime import datetime
 from .base_agent import BaseAgent
-from shared.protocols import AP2PaymentRequest, AP2PaymentResponse, PaymentStatus, PaymentAmount, PaymentMethod
-from shared.database import get_session, Payment, Booking
+from shared.protocols import AP2PaymentRequest, AP2PaymentResponse, PaymentStatus
+from shared.database import get_async_session, utc_datetime_from_ns, confirm_paid_bookings, Payment, Booking
+from sqlalchemy import select
+from shared.write_behind import WriteBehindQueue
+from shared.ids import fast_id
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Payment rows are persisted in the background so the AP2 response isn't held up by the commit;
+# the paid booking is confirmed in the same transaction
+payment_writer = WriteBehindQueue(Payment, wal_key="payment_wal", after_insert=confirm_paid_bookings)
+
+MERCHANT = {
+    "id": "travel_assistant",
+    "descriptor": "Travel Booking"
+}
+
 
 class PaymentAgent(BaseAgent):
     """Agent for payment processing using AP2 protocol"""
     
+    # Payment providers are external and rate limited
+    max_inflight = 8
+    
     def __init__(self, agent_id: str = "payment_agent"):
         super().__init__(
             agent_id=agent_id,
@@ -31,34 +47,26 @@ class PaymentAgent(BaseAgent):
     async def process_payment(self, parameters: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Process payment using AP2 protocol"""
         try:
-            # Build AP2 payment request
-            payment_request = AP2PaymentRequest(
-                action="payment_process",
-                amount=PaymentAmount(
-                    value=parameters["amount"],
-                    currency=parameters.get("currency", "USD")
-                ),
-                payment_method=PaymentMethod(
-                    type=parameters["payment_method"]["type"],
-                    token=parameters["payment_method"]["token"],
-                    last_four=parameters["payment_method"].get("last_four"),
-                    brand=parameters["payment_method"].get("brand")
-                ),
-                merchant={
-                    "id": "travel_assistant",
-                    "descriptor": "Travel Booking"
+            # Build AP2 payment request - nested amount/payment method are validated in one pass
+            payment_request = AP2PaymentRequest.model_validate({
+                "action": "payment_process",
+                "amount": {
+                    "value": parameters["amount"],
+                    "currency": parameters.get("currency", "USD")
                 },
-                metadata=parameters.get("metadata", {})
-            )
+                "payment_method": parameters["payment_method"],
+                "merchant": MERCHANT,
+                "metadata": parameters.get("metadata", {})
+            })
             
-            logger.info(f"Processing AP2 payment: {payment_request.payment_id}")
+            logger.info("Processing AP2 payment: %s", payment_request.payment_id)
             
             # Mock payment processing (in production, integrate with Stripe/PayPal)
             # Simulate payment processing
-            transaction_id = f"txn_{uuid.uuid4().hex[:16]}"
+            transaction_id = fast_id("txn")
             
-            # Create payment response
-            payment_response = AP2PaymentResponse(
+            # Create payment response (fields already validated above)
+            payment_response = AP2PaymentResponse.model_construct(
                 payment_id=payment_request.payment_id,
                 status=PaymentStatus.COMPLETED,
                 transaction_id=transaction_id,
@@ -69,33 +77,27 @@ class PaymentAgent(BaseAgent):
             # Save to database (only if booking_id provided)
             booking_id = parameters.get("metadata", {}).get("booking_id")
             if booking_id:
-                session = get_session()
-                try:
-                    payment = Payment(
-                        id=payment_request.payment_id,
-                        booking_id=booking_id,
-                        amount=payment_request.amount.value,
-                        currency=payment_request.amount.currency,
-                        status="paid",
-                        payment_method_token=payment_request.payment_method.token,
-                        payment_method_type=payment_request.payment_method.type,
-                        last_four=payment_request.payment_method.last_four,
-                        transaction_id=transaction_id,
-                        receipt_url=payment_response.receipt_url,
-                        paid_at=datetime.utcnow()
-                    )
-                    session.add(payment)
-                    session.commit()
-                    logger.info(f"✓ Payment saved to database: {payment_request.payment_id}")
-                finally:
-                    session.close()
+                payment_writer.put({
+                    "id": payment_request.payment_id,
+                    "booking_id": booking_id,
+                    "amount": payment_request.amount.value,
+                    "currency": payment_request.amount.currency,
+                    "status": "paid",
+                    "payment_method_token": payment_request.payment_method.token,
+                    "payment_method_type": payment_request.payment_method.type,
+                    "last_four": payment_request.payment_method.last_four,
+                    "transaction_id": transaction_id,
+                    "receipt_url": payment_response.receipt_url,
+                    "paid_at": time.time_ns()
+                })
+                logger.info("✓ Payment queued for persistence: %s", payment_request.payment_id)
             else:
-                logger.info(f"✓ Payment processed (not persisted - no booking_id): {payment_request.payment_id}")
+                logger.info("✓ Payment processed (not persisted - no booking_id): %s", payment_request.payment_id)
             
             return payment_response.model_dump()
             
         except Exception as e:
-            logger.error(f"Payment processing error: {e}")
+            logger.error("Payment processing error: %s", e)
             return {
                 "payment_id": parameters.get("payment_id", str(uuid.uuid4())),
                 "status": "failed",
@@ -111,19 +113,17 @@ class PaymentAgent(BaseAgent):
             logger.info(f"Processing refund for payment: {payment_id}")
             
             # Mock refund processing
-            refund_id = f"rfnd_{uuid.uuid4().hex[:16]}"
+            refund_id = fast_id("rfnd")
             
             # Update database
-            session = get_session()
-            try:
-                payment = session.query(Payment).filter_by(id=payment_id).first()
+            async with get_async_session() as session:
+                result = await session.execute(select(Payment).filter_by(id=payment_id))
+                payment = result.scalar_one_or_none()
                 if payment:
                     payment.status = "refunded"
-                    payment.refunded_at = datetime.utcnow()
-                    session.commit()
+                    payment.refunded_at = utc_datetime_from_ns(time.time_ns())
+                    await session.commit()
                     logger.info(f"✓ Payment refunded: {payment_id}")
-            finally:
-                session.close()
             
             return {
                 "success": True,
@@ -159,5 +159,7 @@ class PaymentAgent(BaseAgent):
         }
 
 
-# Global instance
-payment_agent = PaymentAgent()
+@functools.cache
+def get_payment_agent() -> PaymentAgent:
+    """Get the process-wide PaymentAgent, created on first use"""
+    return PaymentAgent()
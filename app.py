@@ -1,17 +1,24 @@
 from flask import Flask, render_template, request, jsonify, Response
 from flask_cors import CORS
+from concurrent.futures import ThreadPoolExecutor
 import uuid
 import os
+import logging
 from dotenv import load_dotenv
 
 from modules.elasticsearch_setup import get_elasticsearch_client
 from modules.search import search_travel_data
 from modules.agent import chat, chat_stream, extract_preferences, generate_itinerary
 from modules.data_loader import initialize_vertex_ai
+from shared.conversation_store import conversation_store
+from shared.json_provider import ORJSONProvider
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)
 
 # Initialize services
@@ -19,12 +26,15 @@ try:
     initialize_vertex_ai()
     es_client = get_elasticsearch_client()
     print("✓ Services initialized successfully")
-except Exception as e:
-    print(f"✗ Error initializing services: {e}")
+except Exception:
+    logger.exception("✗ Error initializing services")
     es_client = None
 
-# Store conversation state (in production, use Redis or database)
-conversations = {}
+# Runs the search round trip alongside conversation state lookups
+search_executor = ThreadPoolExecutor(max_workers=8)
+
+# Persists finished chat turns off the streaming path
+persist_executor = ThreadPoolExecutor(max_workers=4)
 
 @app.route('/')
 def index():
@@ -54,39 +64,35 @@ def chat_endpoint():
         if not es_client:
             return jsonify({'error': 'Search service unavailable'}), 503
         
-        # Get or create conversation
-        if conversation_id not in conversations:
-            conversations[conversation_id] = {
-                'messages': [],
-                'preferences': {}
-            }
+        # Search for relevant travel data in the background; it only depends on the message
+        search_future = search_executor.submit(search_travel_data, es_client, user_message, size=10)
         
-        conversation = conversations[conversation_id]
+        # Load conversation state
+        history_text = conversation_store.get_history_text(conversation_id)
         
         # Extract preferences from message
-        new_prefs = extract_preferences(user_message, conversation['messages'])
-        conversation['preferences'].update(new_prefs)
+        new_prefs = extract_preferences(user_message)
+        preferences = conversation_store.update_preferences(conversation_id, new_prefs)
         
-        # Search for relevant travel data
-        search_results = search_travel_data(es_client, user_message, size=10)
+        search_results = search_future.result()
         
         # Generate streaming response
         def generate():
             full_response = ""
-            for chunk in chat_stream(user_message, search_results, 
-                                    conversation['messages'], 
-                                    conversation['preferences']):
+            for chunk in chat_stream(user_message, search_results, preferences=preferences, history_text=history_text):
                 full_response += chunk
                 yield chunk
             
-            # Save conversation
-            conversation['messages'].append({'role': 'user', 'content': user_message})
-            conversation['messages'].append({'role': 'assistant', 'content': full_response})
+            # Save conversation out of band so the stream closes without waiting on Redis
+            persist_executor.submit(conversation_store.append_messages, conversation_id, [
+                {'role': 'user', 'content': user_message},
+                {'role': 'assistant', 'content': full_response}
+            ])
         
         return Response(generate(), mimetype='text/plain')
         
     except Exception as e:
-        print(f"Error in chat endpoint: {e}")
+        logger.exception("Error in chat endpoint")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/itinerary', methods=['POST'])
@@ -114,13 +120,16 @@ def itinerary_endpoint():
         })
         
     except Exception as e:
-        print(f"Error in itinerary endpoint: {e}")
+        logger.exception("Error in itinerary endpoint")
         return jsonify({'error': str(e)}), 500
 
 @app.errorhandler(500)
 def internal_error(error):
     """Handle internal server errors"""
-    return jsonify({'error': 'Internal server error', 'message': str(error)}), 500
+    body = {'error': 'Internal server error'}
+    if app.debug:
+        body['message'] = str(error)
+    return jsonify(body), 500
 
 @app.errorhandler(404)
 def not_found(error):
@@ -3,9 +3,13 @@ Enhanced Flask Application v2.0 with MCP, A2A, and AP2
 """
 from flask import Flask, render_template, request, jsonify, Response
 from flask_cors import CORS
+from flask_compress import Compress
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
+import orjson
 import uuid
 import os
+import logging
 from dotenv import load_dotenv
 
 # v1.0 imports
@@ -15,15 +19,31 @@ from modules.agent import chat_stream, extract_preferences, generate_itinerary
 from modules.data_loader import initialize_vertex_ai
 
 # v2.0 imports
-from agents.flight_agent import flight_agent
-from agents.payment_agent import payment_agent
-from agents.orchestrator import orchestrator
+from agents.flight_agent import get_flight_agent
+from agents.payment_agent import get_payment_agent, payment_writer
+from agents.orchestrator import get_orchestrator
 from shared.database import init_database, get_session, Booking, Payment, User
 from shared.redis_client import redis_client
+from shared.conversation_store import conversation_store
+from shared.json_provider import ORJSONProvider
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
+# Compress JSON responses; text/plain is left out so the chat stream flushes per chunk. Streamed
+# responses (the bookings list) are skipped too - Flask-Compress would buffer the whole body first
+app.config.update(
+    COMPRESS_MIMETYPES=['application/json'],
+    COMPRESS_STREAMS=False,
+    COMPRESS_ALGORITHM=['br', 'gzip'],
+    COMPRESS_BR_LEVEL=4,
+    COMPRESS_LEVEL=6,
+    COMPRESS_MIN_SIZE=1024
+)
+Compress(app)
 CORS(app)
 
 # Initialize services
@@ -32,12 +52,25 @@ try:
     es_client = get_elasticsearch_client()
     init_database()
     print("✓ All services initialized successfully")
-except Exception as e:
-    print(f"✗ Error initializing services: {e}")
+except Exception:
+    logger.exception("✗ Error initializing services")
     es_client = None
 
-# Store conversation state
-conversations = {}
+# Replay payments queued by a previous process; a failure here mustn't take search down with it
+try:
+    payment_writer.recover()
+except Exception:
+    logger.exception("✗ Error recovering queued payments")
+
+# Consume each agent's A2A queue so orchestrated workflows receive their replies
+for agent in (get_orchestrator(), get_flight_agent(), get_payment_agent()):
+    agent.start_listening_in_background()
+
+# Runs the search round trip alongside conversation state lookups
+search_executor = ThreadPoolExecutor(max_workers=8)
+
+# Persists finished chat turns off the streaming path
+persist_executor = ThreadPoolExecutor(max_workers=4)
 
 # ============================================================================
 # v1.0 Endpoints (Keep existing functionality)
@@ -73,39 +106,35 @@ def chat_endpoint():
         if not es_client:
             return jsonify({'error': 'Search service unavailable'}), 503
         
-        # Get or create conversation
-        if conversation_id not in conversations:
-            conversations[conversation_id] = {
-                'messages': [],
-                'preferences': {}
-            }
+        # Search for relevant travel data in the background; it only depends on the message
+        search_future = search_executor.submit(search_travel_data, es_client, user_message, size=10)
         
-        conversation = conversations[conversation_id]
+        # Load conversation state
+        history_text = conversation_store.get_history_text(conversation_id)
         
         # Extract preferences
-        new_prefs = extract_preferences(user_message, conversation['messages'])
-        conversation['preferences'].update(new_prefs)
+        new_prefs = extract_preferences(user_message)
+        preferences = conversation_store.update_preferences(conversation_id, new_prefs)
         
-        # Search for relevant travel data
-        search_results = search_travel_data(es_client, user_message, size=10)
+        search_results = search_future.result()
         
         # Generate streaming response
         def generate():
             full_response = ""
-            for chunk in chat_stream(user_message, search_results, 
-                                    conversation['messages'], 
-                                    conversation['preferences']):
+            for chunk in chat_stream(user_message, search_results, preferences=preferences, history_text=history_text):
                 full_response += chunk
                 yield chunk
             
-            # Save conversation
-            conversation['messages'].append({'role': 'user', 'content': user_message})
-            conversation['messages'].append({'role': 'assistant', 'content': full_response})
+            # Save conversation out of band so the stream closes without waiting on Redis
+            persist_executor.submit(conversation_store.append_messages, conversation_id, [
+                {'role': 'user', 'content': user_message},
+                {'role': 'assistant', 'content': full_response}
+            ])
         
         return Response(generate(), mimetype='text/plain')
         
     except Exception as e:
-        print(f"Error in chat endpoint: {e}")
+        logger.exception("Error in chat endpoint")
         return jsonify({'error': str(e)}), 500
 
 # ============================================================================
@@ -118,21 +147,8 @@ async def search_flights_v2():
     try:
         data = request.json
         
-        # Send request to flight agent via orchestrator
-        result = await orchestrator.send_message(
-            to_agent="flight_agent",
-            action="search_flights",
-            parameters={
-                "origin": data.get("origin"),
-                "destination": data.get("destination"),
-                "date": data.get("date"),
-                "passengers": data.get("passengers", 1)
-            }
-        )
-        
-        # In production, wait for async response
-        # For demo, call directly
-        flights_result = await flight_agent.search_flights(
+        # Call the flight agent directly; the result is needed inline
+        flights_result = await get_flight_agent().search_flights(
             parameters={
                 "origin": data.get("origin"),
                 "destination": data.get("destination"),
@@ -160,7 +176,7 @@ async def book_complete_trip():
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
         # Execute workflow via orchestrator
-        result = await orchestrator.book_complete_trip(
+        result = await get_orchestrator().book_complete_trip(
             parameters=data
         )
         
@@ -182,7 +198,7 @@ async def process_payment():
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
         # Process payment via payment agent
-        result = await payment_agent.process_payment(
+        result = await get_payment_agent().process_payment(
             parameters={
                 "amount": data["amount"],
                 "currency": data.get("currency", "USD"),
@@ -205,25 +221,37 @@ def get_user_bookings():
             return jsonify({'error': 'user_id is required'}), 400
         
         session = get_session()
-        try:
-            bookings = session.query(Booking).filter_by(user_id=user_id).all()
-            
-            result = []
-            for booking in bookings:
-                result.append({
-                    'id': booking.id,
-                    'type': booking.type,
-                    'status': booking.status,
-                    'details': booking.details,
-                    'amount': booking.amount,
-                    'currency': booking.currency,
-                    'confirmation_number': booking.confirmation_number,
-                    'created_at': booking.created_at.isoformat() if booking.created_at else None
-                })
-            
-            return jsonify({'bookings': result})
-        finally:
-            session.close()
+        rows = (
+            session.query(
+                Booking.id, Booking.type, Booking.status, Booking.details, Booking.amount,
+                Booking.currency, Booking.confirmation_number, Booking.created_at
+            )
+            .filter_by(user_id=user_id)
+            .yield_per(200)
+        )
+        
+        # Stream the {"bookings": [...]} document row by row instead of building it in memory
+        def generate():
+            try:
+                yield b'{"bookings": ['
+                for i, booking in enumerate(rows):
+                    if i:
+                        yield b','
+                    yield orjson.dumps({
+                        'id': booking.id,
+                        'type': booking.type,
+                        'status': booking.status,
+                        'details': booking.details,
+                        'amount': booking.amount,
+                        'currency': booking.currency,
+                        'confirmation_number': booking.confirmation_number,
+                        'created_at': booking.created_at.isoformat() if booking.created_at else None
+                    })
+                yield b']}'
+            finally:
+                session.close()
+        
+        return Response(generate(), mimetype='application/json')
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -232,15 +260,18 @@ def get_user_bookings():
 def get_agents_status():
     """Get status of all agents"""
     return jsonify({
-        'orchestrator': orchestrator.get_status(),
-        'flight_agent': flight_agent.get_status(),
-        'payment_agent': payment_agent.get_status()
+        'orchestrator': get_orchestrator().get_status(),
+        'flight_agent': get_flight_agent().get_status(),
+        'payment_agent': get_payment_agent().get_status()
     })
 
 @app.errorhandler(500)
 def internal_error(error):
     """Handle internal server errors"""
-    return jsonify({'error': 'Internal server error', 'message': str(error)}), 500
+    body = {'error': 'Internal server error'}
+    if app.debug:
+        body['message'] = str(error)
+    return jsonify(body), 500
 
 @app.errorhandler(404)
 def not_found(error):
@@ -250,4 +281,5 @@ def not_found(error):
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('FLASK_DEBUG', 'True') == 'True'
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    # Each request gets its own thread, so a long chat stream doesn't block other requests
+    app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
@@ -0,0 +1,3 @@
+# test_v2.py is a standalone smoke script against live services (python test_v2.py); its
+# test_* coroutines take a TestLogger argument and aren't pytest tests
+collect_ignore = ["test_v2.py"]
@@ -2,7 +2,8 @@
 Base MCP Server implementation
 """
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Awaitable, Callable, List, Optional
+import asyncio
 import logging
 from shared.protocols import MCPTool, MCPToolCall, MCPToolResult
 
@@ -17,6 +18,7 @@ class BaseMCPServer(ABC):
         self.name = name
         self.version = version
         self.tools: Dict[str, MCPTool] = {}
+        self._handlers: Dict[str, Callable[[Dict[str, Any], Optional[Dict[str, Any]]], Awaitable[Any]]] = {}
         self._register_tools()
         logger.info(f"✓ Initialized MCP Server: {name} v{version}")
     
@@ -25,9 +27,10 @@ class BaseMCPServer(ABC):
         """Register available tools - must be implemented by subclasses"""
         pass
     
-    def register_tool(self, tool: MCPTool):
-        """Register a tool"""
+    def register_tool(self, tool: MCPTool, handler: Callable[[Dict[str, Any], Optional[Dict[str, Any]]], Awaitable[Any]]):
+        """Register a tool and the coroutine that implements it, called as handler(arguments, context)"""
         self.tools[tool.name] = tool
+        self._handlers[tool.name] = handler
         logger.info(f"  Registered tool: {tool.name}")
     
     def list_tools(self) -> List[MCPTool]:
@@ -41,22 +44,11 @@ class BaseMCPServer(ABC):
     async def handle_tool_call(self, tool_call: MCPToolCall) -> MCPToolResult:
         """Handle a tool call"""
         try:
-            tool = self.get_tool(tool_call.tool_name)
-            if not tool:
-                return MCPToolResult(
-                    success=False,
-                    error=f"Tool '{tool_call.tool_name}' not found"
-                )
-            
             # Validate arguments against schema
             # (In production, use jsonschema validation)
             
             # Call the tool implementation
-            result = await self._execute_tool(
-                tool_call.tool_name,
-                tool_call.arguments,
-                tool_call.context
-            )
+            result = await self._execute_tool(tool_call.tool_name, tool_call.arguments, tool_call.context)
             
             return MCPToolResult(success=True, result=result)
             
@@ -67,15 +59,24 @@ class BaseMCPServer(ABC):
                 error=str(e)
             )
     
-    @abstractmethod
+    async def handle_tool_call_batch(self, tool_calls: List[MCPToolCall]) -> List[MCPToolResult]:
+        """Handle several tool calls in one round trip; results are returned in call order.
+        
+        Servers backed by an API with a native multi-query endpoint should override this.
+        """
+        return list(await asyncio.gather(*[self.handle_tool_call(call) for call in tool_calls]))
+    
     async def _execute_tool(
         self,
         tool_name: str,
         arguments: Dict[str, Any],
         context: Optional[Dict[str, Any]] = None
     ) -> Any:
-        """Execute a tool - must be implemented by subclasses"""
-        pass
+        """Execute a tool through its registered handler"""
+        handler = self._handlers.get(tool_name)
+        if handler is None:
+            raise ValueError(f"Tool '{tool_name}' not found")
+        return await handler(arguments, context)
     
     def get_server_info(self) -> Dict[str, Any]:
         """Get server information"""
@@ -1,12 +1,25 @@
 """
 Flight MCP Server - Mock implementation for demo
 """
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 import random
 from .base_server import BaseMCPServer
 from shared.protocols import MCPTool
 
+# Mock search value pools (ranges match the old randint bounds, inclusive)
+MOCK_RESULT_COUNT = 5
+DEPARTURE_OFFSETS = tuple(timedelta(hours=6 + i*3) for i in range(MOCK_RESULT_COUNT))
+AIRLINES = ("United Airlines", "Delta", "American Airlines", "JetBlue", "Southwest")
+CARRIER_CODES = ("UA", "DL", "AA", "B6", "WN")
+DURATIONS = tuple(timedelta(hours=h) for h in range(2, 9))
+PRICE_PER_PERSON = range(200, 801)
+FLIGHT_IDS = range(1000, 10000)
+FLIGHT_NUMBERS = range(100, 1000)
+STOPS = (0, 0, 0, 1)  # Mostly direct flights
+SEATS_AVAILABLE = range(5, 51)
+CHECKED_BAGS = (0, 1, 2)
+
 
 class FlightMCPServer(BaseMCPServer):
     """MCP Server for flight data"""
@@ -31,7 +44,7 @@ class FlightMCPServer(BaseMCPServer):
                 },
                 "required": ["origin", "destination", "date", "passengers"]
             }
-        ))
+        ), self._search_flights)
         
         # Get flight details tool
         self.register_tool(MCPTool(
@@ -44,7 +57,7 @@ class FlightMCPServer(BaseMCPServer):
                 },
                 "required": ["flight_id"]
             }
-        ))
+        ), self._get_flight_details)
         
         # Book flight tool
         self.register_tool(MCPTool(
@@ -58,62 +71,55 @@ class FlightMCPServer(BaseMCPServer):
                 },
                 "required": ["flight_id", "passenger_details"]
             }
-        ))
-    
-    async def _execute_tool(
-        self,
-        tool_name: str,
-        arguments: Dict[str, Any],
-        context: Optional[Dict[str, Any]] = None
-    ) -> Any:
-        """Execute flight tools"""
-        
-        if tool_name == "search_flights":
-            return await self._search_flights(arguments)
-        elif tool_name == "get_flight_details":
-            return await self._get_flight_details(arguments)
-        elif tool_name == "book_flight":
-            return await self._book_flight(arguments)
-        else:
-            raise ValueError(f"Unknown tool: {tool_name}")
+        ), self._book_flight)
     
-    async def _search_flights(self, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def _search_flights(self, args: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """Mock flight search"""
         origin = args["origin"]
         destination = args["destination"]
         date = args["date"]
         passengers = args["passengers"]
         
-        # Generate mock flight results
-        airlines = ["United Airlines", "Delta", "American Airlines", "JetBlue", "Southwest"]
+        # Generate mock flight results; every random field is drawn for all flights in one call
+        count = MOCK_RESULT_COUNT
+        durations = random.choices(DURATIONS, k=count)
+        prices = random.choices(PRICE_PER_PERSON, k=count)
+        flight_ids = random.choices(FLIGHT_IDS, k=count)
+        airlines = random.choices(AIRLINES, k=count)
+        carriers = random.choices(CARRIER_CODES, k=count)
+        flight_numbers = random.choices(FLIGHT_NUMBERS, k=count)
+        stops = random.choices(STOPS, k=count)
+        seats = random.choices(SEATS_AVAILABLE, k=count)
+        checked_bags = random.choices(CHECKED_BAGS, k=count)
+        departure_base = datetime.fromisoformat(date)
         flights = []
         
-        for i in range(5):
-            departure_time = datetime.fromisoformat(date) + timedelta(hours=6 + i*3)
-            arrival_time = departure_time + timedelta(hours=random.randint(2, 8))
+        for i in range(count):
+            departure_time = departure_base + DEPARTURE_OFFSETS[i]
+            arrival_time = departure_time + durations[i]
             
-            price_per_person = random.randint(200, 800)
+            price_per_person = prices[i]
             
             flight = {
-                "flight_id": f"FL{random.randint(1000, 9999)}",
-                "airline": random.choice(airlines),
-                "flight_number": f"{random.choice(['UA', 'DL', 'AA', 'B6', 'WN'])}{random.randint(100, 999)}",
+                "flight_id": f"FL{flight_ids[i]}",
+                "airline": airlines[i],
+                "flight_number": f"{carriers[i]}{flight_numbers[i]}",
                 "origin": origin,
                 "destination": destination,
                 "departure_time": departure_time.isoformat(),
                 "arrival_time": arrival_time.isoformat(),
-                "duration_minutes": int((arrival_time - departure_time).total_seconds() / 60),
-                "stops": random.choice([0, 0, 0, 1]),  # Mostly direct flights
+                "duration_minutes": durations[i].seconds // 60,
+                "stops": stops[i],
                 "price": {
                     "amount": price_per_person * passengers,
                     "currency": "USD",
                     "per_person": price_per_person
                 },
-                "seats_available": random.randint(5, 50),
+                "seats_available": seats[i],
                 "cabin_class": "Economy",
                 "baggage": {
                     "carry_on": 1,
-                    "checked": random.choice([0, 1, 2])
+                    "checked": checked_bags[i]
                 }
             }
             flights.append(flight)
@@ -123,7 +129,7 @@ class FlightMCPServer(BaseMCPServer):
         
         return flights
     
-    async def _get_flight_details(self, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def _get_flight_details(self, args: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Get flight details"""
         flight_id = args["flight_id"]
         
@@ -155,7 +161,7 @@ class FlightMCPServer(BaseMCPServer):
             "cancellation_policy": "Free cancellation up to 24 hours before departure"
         }
     
-    async def _book_flight(self, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def _book_flight(self, args: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Mock flight booking"""
         flight_id = args["flight_id"]
         passenger_details = args["passenger_details"]
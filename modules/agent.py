@@ -1,13 +1,28 @@
 import os
+import re
 import json
+import hashlib
+import logging
+import orjson
 import google.generativeai as genai
 from dotenv import load_dotenv
 
+from shared.redis_client import redis_client
+from shared.conversation_store import PROMPT_HISTORY_MESSAGES, format_history_line
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Initialize Gemini
 genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
 
+# Shared model instance - generate_content keeps no per-call state, so one instance serves all requests
+model = genai.GenerativeModel(os.getenv('GEMINI_MODEL', 'gemini-2.0-flash-exp'))
+
+# Cached first-turn responses (seconds)
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+
 SYSTEM_PROMPT = """You are an enthusiastic and knowledgeable travel planning assistant. Your goal is to help users plan amazing trips by providing personalized recommendations based on their preferences and interests.
 
 Key guidelines:
@@ -20,187 +35,284 @@ Key guidelines:
 - Format responses clearly with recommendations organized by type (destinations, activities, hotels, restaurants)
 """
 
+# Preference keyword buckets, matched against message tokens
+BUDGET_KEYWORDS = (
+    ('low', '$', frozenset({'cheap', 'budget', 'affordable', 'inexpensive'})),
+    ('high', '$$$', frozenset({'luxury', 'expensive', 'high-end', 'upscale'})),
+    ('moderate', '$$', frozenset({'moderate', 'mid-range', 'reasonable'}))
+)
+
+INTEREST_KEYWORDS = {
+    'cultural': frozenset({'culture', 'cultural', 'temple', 'museum', 'history', 'historical'}),
+    'nature': frozenset({'nature', 'hiking', 'mountain', 'beach', 'outdoor', 'scenic'}),
+    'food': frozenset({'food', 'restaurant', 'cuisine', 'dining', 'eat', 'eatery'}),
+    'adventure': frozenset({'adventure', 'exciting', 'thrill', 'active'}),
+    'relaxation': frozenset({'relax', 'spa', 'peaceful', 'calm', 'quiet'}),
+    'romantic': frozenset({'romantic', 'honeymoon', 'couple'}),
+    'photography': frozenset({'photo', 'photograph', 'photography', 'instagram', 'instagrammable'})
+}
+
+# Reverse index keyword -> interest, and each interest's position so results keep INTEREST_KEYWORDS order
+INTEREST_INDEX = {keyword: interest for interest, keywords in INTEREST_KEYWORDS.items() for keyword in keywords}
+INTEREST_ORDER = {interest: position for position, interest in enumerate(INTEREST_KEYWORDS)}
+
+TOKEN_PATTERN = re.compile(r"[a-z]+(?:-[a-z]+)*")
+
+# Suffixes stripped (repeatedly) when stemming tokens
+STEM_SUFFIXES = ('s', 'es', 'ing', 'ed', 'er', 'est', 'ie', 'ly', 'ally', 'ation')
+
+def tokenize_message(message):
+    """Split a message into lowercase word tokens, plus stems with common suffixes removed so
+    plurals, verb forms, comparatives and adverbs ("restaurants", "relaxed", "cheapest", "foodies",
+    "culturally") still hit their keyword"""
+    tokens = set(TOKEN_PATTERN.findall(message.lower()))
+    pending = list(tokens)
+    while pending:
+        token = pending.pop()
+        for suffix in STEM_SUFFIXES:
+            if token.endswith(suffix) and len(token) > len(suffix) + 2:
+                stem = token[:-len(suffix)]
+                if stem not in tokens:
+                    tokens.add(stem)
+                    pending.append(stem)
+    return frozenset(tokens)
+
 def extract_preferences(message, conversation_history=None):
     """Extract user preferences from conversation"""
     preferences = {}
     
-    message_lower = message.lower()
+    tokens = tokenize_message(message)
     
     # Budget detection
-    if any(word in message_lower for word in ['cheap', 'budget', 'affordable', 'inexpensive']):
-        preferences['budget'] = 'low'
-        preferences['price_range'] = '$'
-    elif any(word in message_lower for word in ['luxury', 'expensive', 'high-end', 'upscale']):
-        preferences['budget'] = 'high'
-        preferences['price_range'] = '$$$'
-    elif any(word in message_lower for word in ['moderate', 'mid-range', 'reasonable']):
-        preferences['budget'] = 'moderate'
-        preferences['price_range'] = '$$'
+    for budget, price_range, keywords in BUDGET_KEYWORDS:
+        if not keywords.isdisjoint(tokens):
+            preferences['budget'] = budget
+            preferences['price_range'] = price_range
+            break
     
     # Interest detection
-    interests = []
-    interest_keywords = {
-        'cultural': ['culture', 'cultural', 'temple', 'museum', 'history', 'historical'],
-        'nature': ['nature', 'hiking', 'mountain', 'beach', 'outdoor', 'scenic'],
-        'food': ['food', 'restaurant', 'cuisine', 'dining', 'eat'],
-        'adventure': ['adventure', 'exciting', 'thrill', 'active'],
-        'relaxation': ['relax', 'spa', 'peaceful', 'calm', 'quiet'],
-        'romantic': ['romantic', 'honeymoon', 'couple'],
-        'photography': ['photo', 'photography', 'instagram']
-    }
-    
-    for interest, keywords in interest_keywords.items():
-        if any(keyword in message_lower for keyword in keywords):
-            interests.append(interest)
+    interests = sorted(
+        {INTEREST_INDEX[token] for token in tokens if token in INTEREST_INDEX},
+        key=INTEREST_ORDER.__getitem__
+    )
     
     if interests:
         preferences['interests'] = interests
     
     return preferences
 
-def build_rag_prompt(user_message, search_results, conversation_history=None, preferences=None):
-    """Build RAG prompt with search results as context"""
+def build_rag_prompt(user_message, search_results, conversation_history=None, preferences=None, history_text=None):
+    """Build RAG prompt with search results as context
+    
+    history_text is the pre-rendered history kept by the conversation store;
+    when given, conversation_history is not reformatted.
+    """
+    parts = [SYSTEM_PROMPT, "\n\n"]
+    
+    # Format conversation history
+    if history_text is None and conversation_history:
+        history_text = ''.join(map(format_history_line, conversation_history[-PROMPT_HISTORY_MESSAGES:]))
+    if history_text:
+        parts.extend(("CONVERSATION HISTORY:\n", history_text, "\n"))
+    
+    # Format preferences
+    if preferences:
+        parts.append("USER PREFERENCES:\n")
+        if preferences.get('budget'):
+            parts.append(f"- Budget: {preferences['budget']}\n")
+        if preferences.get('interests'):
+            parts.append(f"- Interests: {', '.join(preferences['interests'])}\n")
+        parts.append("\n")
     
     # Format search results
-    context = "AVAILABLE TRAVEL OPTIONS:\n\n"
+    parts.append("AVAILABLE TRAVEL OPTIONS:\n\n")
     
     for i, result in enumerate(search_results, 1):
-        context += f"{i}. {result['name']} ({result['type'].upper()})\n"
-        context += f"   Location: {result['location'].get('city', '')}, {result['location'].get('country', '')}\n"
-        context += f"   Description: {result['description']}\n"
-        context += f"   Price: {result.get('price_range', 'N/A')} | Rating: {result.get('rating', 'N/A')}/5\n"
+        parts.extend((
+            f"{i}. {result['name']} ({result['type'].upper()})\n",
+            f"   Location: {result['location'].get('city', '')}, {result['location'].get('country', '')}\n",
+            f"   Description: {result['description']}\n",
+            f"   Price: {result.get('price_range', 'N/A')} | Rating: {result.get('rating', 'N/A')}/5\n"
+        ))
         
         if result.get('categories'):
-            context += f"   Categories: {', '.join(result['categories'])}\n"
+            parts.append(f"   Categories: {', '.join(result['categories'])}\n")
         if result.get('highlights'):
-            context += f"   Highlights: {', '.join(result['highlights']) if isinstance(result['highlights'], list) else result['highlights']}\n"
+            parts.append(f"   Highlights: {', '.join(result['highlights']) if isinstance(result['highlights'], list) else result['highlights']}\n")
         if result.get('amenities'):
-            context += f"   Amenities: {', '.join(result['amenities'])}\n"
+            parts.append(f"   Amenities: {', '.join(result['amenities'])}\n")
         if result.get('cuisine'):
-            context += f"   Cuisine: {result['cuisine']}\n"
+            parts.append(f"   Cuisine: {result['cuisine']}\n")
         if result.get('duration_hours'):
-            context += f"   Duration: {result['duration_hours']} hours\n"
+            parts.append(f"   Duration: {result['duration_hours']} hours\n")
         
-        context += "\n"
-    
-    # Format conversation history
-    history_text = ""
-    if conversation_history:
-        history_text = "CONVERSATION HISTORY:\n"
-        for msg in conversation_history[-4:]:  # Last 4 messages
-            role = msg.get('role', 'user')
-            content = msg.get('content', '')
-            history_text += f"{role.upper()}: {content}\n"
-        history_text += "\n"
-    
-    # Format preferences
-    pref_text = ""
-    if preferences:
-        pref_text = "USER PREFERENCES:\n"
-        if preferences.get('budget'):
-            pref_text += f"- Budget: {preferences['budget']}\n"
-        if preferences.get('interests'):
-            pref_text += f"- Interests: {', '.join(preferences['interests'])}\n"
-        pref_text += "\n"
+        parts.append("\n")
     
     # Build full prompt
-    prompt = f"""{SYSTEM_PROMPT}
-
-{history_text}{pref_text}{context}
+    parts.append(f"""
 
 USER QUESTION: {user_message}
 
-Provide a helpful, conversational response with specific recommendations from the available options. Explain why each recommendation matches the user's needs."""
+Provide a helpful, conversational response with specific recommendations from the available options. Explain why each recommendation matches the user's needs.""")
     
-    return prompt
+    return ''.join(parts)
+
 
+def response_cache_key(user_message, search_results, conversation_history=None, preferences=None, history_text=None):
+    """Build a cache key for a response, or None if the response depends on prior turns.
+    
+    The message is normalized (case, punctuation, whitespace) so trivially
+    different phrasings of the same question share an entry, and the key
+    includes the retrieved result IDs and preferences so a change in context
+    never serves a stale answer.
+    """
+    if conversation_history or history_text:
+        return None
+    
+    normalized = ' '.join(re.findall(r"[a-z0-9$]+", user_message.lower()))
+    payload = json.dumps({
+        'message': normalized,
+        'results': [result.get('id') for result in search_results],
+        'preferences': preferences or {}
+    }, sort_keys=True)
+    return f"gemini:response:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+def get_cached_response(cache_key):
+    """Look up a cached response; cache failures never block the chat path"""
+    if not cache_key:
+        return None
+    try:
+        return redis_client.get(cache_key)
+    except Exception as e:
+        logger.warning("Response cache unavailable: %s", e)
+        return None
 
-def chat(user_message, search_results, conversation_history=None, preferences=None):
+def cache_response(cache_key, response_text):
+    """Store a response for RESPONSE_CACHE_TTL seconds"""
+    if not cache_key or not response_text:
+        return
+    try:
+        redis_client.set(cache_key, response_text, ttl=RESPONSE_CACHE_TTL)
+    except Exception as e:
+        logger.warning("Failed to cache response: %s", e)
+
+def chat(user_message, search_results, conversation_history=None, preferences=None, history_text=None):
     """Generate conversational response using Gemini"""
+    cache_key = response_cache_key(user_message, search_results, conversation_history, preferences, history_text)
+    cached = get_cached_response(cache_key)
+    if cached:
+        return cached
+    
     try:
         # Build prompt with RAG context
-        prompt = build_rag_prompt(user_message, search_results, conversation_history, preferences)
-        
-        # Initialize Gemini model (use correct model name for API)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        prompt = build_rag_prompt(user_message, search_results, conversation_history, preferences, history_text)
         
         # Generate response
         response = model.generate_content(prompt)
         
+        cache_response(cache_key, response.text)
         return response.text
         
-    except Exception as e:
-        print(f"Error generating Gemini response: {e}")
+    except Exception:
+        logger.exception("Error generating Gemini response")
         # Fallback to raw search results
         fallback = "I found these travel options for you:\n\n"
         for result in search_results[:5]:
             fallback += f"• {result['name']} - {result['description'][:100]}...\n"
         return fallback
 
-def chat_stream(user_message, search_results, conversation_history=None, preferences=None):
+def chat_stream(user_message, search_results, conversation_history=None, preferences=None, history_text=None):
     """Generate streaming response using Gemini"""
+    cache_key = response_cache_key(user_message, search_results, conversation_history, preferences, history_text)
+    cached = get_cached_response(cache_key)
+    if cached:
+        yield cached
+        return
+    
     try:
         # Build prompt with RAG context
-        prompt = build_rag_prompt(user_message, search_results, conversation_history, preferences)
-        
-        # Initialize Gemini model (use correct model name for API)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        prompt = build_rag_prompt(user_message, search_results, conversation_history, preferences, history_text)
         
         # Generate streaming response
         response = model.generate_content(prompt, stream=True)
         
+        chunks = []
         for chunk in response:
             if chunk.text:
+                chunks.append(chunk.text)
                 yield chunk.text
         
-    except Exception as e:
-        print(f"Error generating streaming response: {e}")
+        # Only complete streams are cached
+        cache_response(cache_key, ''.join(chunks))
+        
+    except Exception:
+        logger.exception("Error generating streaming response")
         yield f"I encountered an error, but here are the search results I found:\n\n"
         for result in search_results[:5]:
             yield f"• {result['name']} - {result['description'][:100]}...\n"
 
+RECOMMENDATION_FIELDS = (('name', 'name'), ('type', 'type'), ('rating', 'rating'), ('price_range', 'price_range'), ('location', 'location'))
+
 def parse_recommendations(response_text, search_results):
     """Parse structured recommendations from Gemini response"""
-    recommendations = []
+    text = response_text.lower()
     
     # Match mentioned items from search results
-    for result in search_results:
-        if result['name'].lower() in response_text.lower():
-            recommendations.append({
-                'name': result['name'],
-                'type': result['type'],
-                'rating': result.get('rating'),
-                'price_range': result.get('price_range'),
-                'location': result.get('location')
-            })
-    
-    return recommendations
+    mentioned = [result for result in search_results if result['name'].lower() in text]
+    return project(mentioned, RECOMMENDATION_FIELDS)
 
 
+# (prompt key, search result field) pairs embedded in the itinerary prompt
+ITINERARY_ACTIVITY_FIELDS = (('name', 'name'), ('description', 'description'), ('duration', 'duration_hours'), ('best_time', 'best_time'))
+ITINERARY_RESTAURANT_FIELDS = (('name', 'name'), ('description', 'description'), ('cuisine', 'cuisine'), ('price', 'price_range'))
+
+# Only these _source fields are fetched for itinerary searches (skips embeddings and unused text).
+# Deduplicated in a stable order so identical searches serialize identically for the shard request cache.
+ITINERARY_SOURCE_FIELDS = tuple(dict.fromkeys(
+    ('id', 'type') + tuple(field for _, field in ITINERARY_ACTIVITY_FIELDS + ITINERARY_RESTAURANT_FIELDS)
+))
+
+# Descriptions are cut to this many characters in the itinerary prompt
+ITINERARY_DESCRIPTION_LIMIT = 200
+
+def project(rows, fields):
+    """Project search results onto (key, field) pairs"""
+    return [{key: row.get(field) for key, field in fields} for row in rows]
+
+def compact(rows, fields, description_limit=ITINERARY_DESCRIPTION_LIMIT):
+    """Project search results for a prompt, dropping empty values and truncating descriptions"""
+    compacted = []
+    for row in rows:
+        item = {key: value for key, field in fields if (value := row.get(field)) is not None}
+        if 'description' in item:
+            item['description'] = item['description'][:description_limit]
+        compacted.append(item)
+    return compacted
+
 def generate_itinerary(destination, days, preferences, es):
     """Generate day-by-day itinerary using Gemini and search"""
-    from modules.search import search_travel_data
+    from modules.search import search_travel_data_multi
     
     try:
-        # Search for activities and restaurants in the destination
+        # Search for activities and restaurants in the destination (one round trip)
         city = destination.split(',')[0].strip()
         
-        activities = search_travel_data(es, f"activities in {city}", 
-                                       filters={'type': 'activity'}, size=15)
-        restaurants = search_travel_data(es, f"restaurants in {city}", 
-                                        filters={'type': 'restaurant'}, size=10)
+        activities, restaurants = search_travel_data_multi(es, [
+            (f"activities in {city}", {'type': 'activity'}, 15),
+            (f"restaurants in {city}", {'type': 'restaurant'}, 10)
+        ], source_fields=ITINERARY_SOURCE_FIELDS)
         
         # Build itinerary prompt
         prompt = f"""Create a detailed {days}-day itinerary for {destination}.
 
 AVAILABLE ACTIVITIES:
-{json.dumps([{'name': a['name'], 'description': a['description'], 'duration': a.get('duration_hours'), 'best_time': a.get('best_time')} for a in activities], indent=2)}
+{orjson.dumps(compact(activities, ITINERARY_ACTIVITY_FIELDS)).decode()}
 
 AVAILABLE RESTAURANTS:
-{json.dumps([{'name': r['name'], 'description': r['description'], 'cuisine': r.get('cuisine'), 'price': r.get('price_range')} for r in restaurants], indent=2)}
+{orjson.dumps(compact(restaurants, ITINERARY_RESTAURANT_FIELDS)).decode()}
 
 USER PREFERENCES:
-{json.dumps(preferences, indent=2)}
+{orjson.dumps(preferences).decode()}
 
 Create a day-by-day itinerary with:
 - Morning, afternoon, and evening activities
@@ -218,12 +330,10 @@ Dinner (7:00 PM): [Restaurant] - [Why it's recommended]
 
 Continue for all {days} days."""
 
-        # Initialize Gemini model (use correct model name for API)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
         response = model.generate_content(prompt)
         
         return response.text
         
-    except Exception as e:
-        print(f"Error generating itinerary: {e}")
+    except Exception:
+        logger.exception("Error generating itinerary")
         return f"I encountered an error generating the itinerary. Please try again or ask for specific recommendations for {destination}."
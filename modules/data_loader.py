@@ -1,11 +1,33 @@
-import json
+import asyncio
+import functools
+import math
 import os
+import uuid
+from itertools import chain, islice
+import ijson
+import orjson
 from google.cloud import aiplatform
 from vertexai.language_models import TextEmbeddingModel
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Corpora larger than this are embedded by a Vertex AI batch prediction job
+# (when EMBEDDING_BATCH_BUCKET is set) instead of online get_embeddings calls
+BATCH_PREDICTION_THRESHOLD = 500
+
+# Data files at least this large are parsed incrementally with ijson
+STREAMING_LOAD_THRESHOLD = 1024 * 1024
+
+# Bulk indexing: worker threads, documents per request and bytes per request
+BULK_THREAD_COUNT = int(os.getenv('BULK_THREAD_COUNT', '4'))
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', '1000'))
+BULK_MAX_CHUNK_BYTES = 10 * 1024 * 1024
+
+# Online embedding requests: texts per request (API max) and requests in flight
+EMBEDDING_BATCH_SIZE = 250
+EMBEDDING_CONCURRENCY = 32
+
 def initialize_vertex_ai():
     """Initialize Vertex AI with project credentials"""
     project_id = os.getenv('GOOGLE_CLOUD_PROJECT')
@@ -15,92 +37,212 @@ def initialize_vertex_ai():
     aiplatform.init(project=project_id)
     print(f"✓ Initialized Vertex AI for project: {project_id}")
 
+@functools.lru_cache(maxsize=4)
+def get_embedding_model(model_name='text-embedding-004'):
+    """Load an embedding model once per process; from_pretrained resolves model metadata remotely"""
+    return TextEmbeddingModel.from_pretrained(model_name)
+
+def normalize_vector(values):
+    """Scale a vector to unit length; the index scores with dot_product, which expects unit vectors"""
+    norm = math.sqrt(sum(value * value for value in values))
+    if not norm:
+        return list(values)
+    return [value / norm for value in values]
+
+def is_indexable_embedding(doc, embedding):
+    """Check an embedding can be indexed; dot_product rejects zero vectors, failing the document in bulk"""
+    if not embedding:
+        return False
+    if not any(embedding):
+        print(f"  Skipping document {doc.get('id', '<no id>')}: zero embedding vector")
+        return False
+    return True
+
 def load_json_data(file_path):
-    """Load JSON data from file"""
+    """Yield records from a JSON array file; large files are parsed incrementally"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        print(f"✓ Loaded {len(data)} records from {file_path}")
-        return data
+        if os.path.getsize(file_path) < STREAMING_LOAD_THRESHOLD:
+            with open(file_path, 'rb') as f:
+                data = orjson.loads(f.read())
+            print(f"✓ Loaded {len(data)} records from {file_path}")
+            yield from data
+            return
+        
+        count = 0
+        with open(file_path, 'rb') as f:
+            for count, record in enumerate(ijson.items(f, 'item', use_float=True), 1):
+                yield record
+        print(f"✓ Streamed {count} records from {file_path}")
     except Exception as e:
         print(f"✗ Error loading {file_path}: {e}")
-        return []
 
 def generate_embeddings_batch(texts, model_name='text-embedding-004'):
     """Generate embeddings for a batch of texts using Vertex AI"""
     try:
-        model = TextEmbeddingModel.from_pretrained(model_name)
-        embeddings = model.get_embeddings(texts)
-        return [emb.values for emb in embeddings]
+        embeddings = get_embedding_model(model_name).get_embeddings(texts)
+        return [normalize_vector(emb.values) for emb in embeddings]
     except Exception as e:
         print(f"✗ Error generating embeddings: {e}")
         return None
 
+def generate_embeddings_batch_job(texts, model_name='text-embedding-004'):
+    """Generate embeddings with one Vertex AI batch prediction job, staged through GCS
+    
+    Returns embeddings in input order (None for any text missing from the
+    output), or None if the job fails.
+    """
+    from google.cloud import storage
+    
+    bucket_name = os.getenv('EMBEDDING_BATCH_BUCKET')
+    job_name = f"embeddings-{uuid.uuid4().hex}"
+    
+    try:
+        # Stage inputs as JSONL, one {"content": ...} instance per line
+        bucket = storage.Client().bucket(bucket_name)
+        bucket.blob(f"{job_name}/input.jsonl").upload_from_string(
+            b'\n'.join(orjson.dumps({'content': text}) for text in texts),
+            content_type='application/jsonl'
+        )
+        
+        print(f"Submitting batch embedding job {job_name} for {len(texts)} texts...")
+        job = aiplatform.BatchPredictionJob.create(
+            job_display_name=job_name,
+            model_name=f"publishers/google/models/{model_name}",
+            instances_format='jsonl',
+            predictions_format='jsonl',
+            gcs_source=f"gs://{bucket_name}/{job_name}/input.jsonl",
+            gcs_destination_prefix=f"gs://{bucket_name}/{job_name}/output",
+            sync=True
+        )
+        
+        # Output order isn't guaranteed; each line echoes its instance
+        embeddings_by_text = {}
+        for blob in job.iter_outputs():
+            for line in blob.download_as_text().splitlines():
+                if line:
+                    row = orjson.loads(line)
+                    embeddings_by_text[row['instance']['content']] = normalize_vector(row['predictions'][0]['embeddings']['values'])
+        
+        return [embeddings_by_text.get(text) for text in texts]
+    except Exception as e:
+        print(f"✗ Error in batch embedding job: {e}")
+        return None
+
 def load_all_travel_data():
-    """Load all travel data files"""
+    """Yield all travel data records, file by file"""
     data_dir = 'data'
-    all_data = []
     
     files = ['destinations.json', 'activities.json', 'hotels.json', 'restaurants.json']
     
     for file_name in files:
         file_path = os.path.join(data_dir, file_name)
         if os.path.exists(file_path):
-            data = load_json_data(file_path)
-            all_data.extend(data)
+            yield from load_json_data(file_path)
         else:
             print(f"⚠ File not found: {file_path}")
-    
-    print(f"✓ Total records loaded: {len(all_data)}")
-    return all_data
 
-def prepare_documents_with_embeddings(data, batch_size=5):
-    """Prepare documents with embeddings for indexing"""
-    print(f"Generating embeddings for {len(data)} documents...")
+async def generate_embeddings_batch_async(model, texts):
+    """Generate embeddings for one batch without blocking the other in-flight batches"""
+    try:
+        embeddings = await model.get_embeddings_async(texts)
+        return [normalize_vector(emb.values) for emb in embeddings]
+    except Exception as e:
+        print(f"✗ Error generating embeddings: {e}")
+        return None
+
+async def prepare_documents_with_embeddings(records, batch_size=EMBEDDING_BATCH_SIZE, model_name='text-embedding-004'):
+    """Prepare documents with embeddings for indexing
     
+    records may be any iterable (e.g. the load_all_travel_data generator);
+    it is consumed one window of concurrent batches at a time.
+    """
+    records = iter(records)
     documents = []
     
-    for i in range(0, len(data), batch_size):
-        batch = data[i:i + batch_size]
-        texts = [doc['description'] for doc in batch]
+    # Read just far enough ahead to choose between a batch job and online requests
+    head = list(islice(records, BATCH_PREDICTION_THRESHOLD + 1))
+    
+    if len(head) > BATCH_PREDICTION_THRESHOLD and os.getenv('EMBEDDING_BATCH_BUCKET'):
+        data = head + list(records)
+        print(f"Generating embeddings for {len(data)} documents...")
+        embeddings = await asyncio.to_thread(generate_embeddings_batch_job, [doc['description'] for doc in data])
+        if embeddings:
+            for doc, embedding in zip(data, embeddings):
+                if is_indexable_embedding(doc, embedding):
+                    doc['embedding'] = embedding
+                    documents.append(doc)
+            print(f"✓ Generated embeddings for {len(documents)} documents")
+            return documents
+        print("  Batch job failed, falling back to online embeddings")
+        records = iter(data)
+    else:
+        print("Generating embeddings...")
+        records = chain(head, records)
+    
+    # Up to EMBEDDING_CONCURRENCY batches run concurrently per window
+    model = get_embedding_model(model_name)
+    batches = iter(lambda: list(islice(records, batch_size)), [])
+    batch_number = 0
+    
+    while window := list(islice(batches, EMBEDDING_CONCURRENCY)):
+        results = await asyncio.gather(*[
+            generate_embeddings_batch_async(model, [doc['description'] for doc in batch])
+            for batch in window
+        ])
         
-        try:
-            embeddings = generate_embeddings_batch(texts)
-            
+        for batch, embeddings in zip(window, results):
+            batch_number += 1
             if embeddings:
                 for doc, embedding in zip(batch, embeddings):
-                    doc['embedding'] = embedding
-                    documents.append(doc)
-                print(f"  Processed {len(documents)}/{len(data)} documents")
+                    if is_indexable_embedding(doc, embedding):
+                        doc['embedding'] = embedding
+                        documents.append(doc)
+                print(f"  Processed {len(documents)} documents")
             else:
-                print(f"  Skipping batch {i//batch_size + 1} due to embedding error")
-                
-        except Exception as e:
-            print(f"  Error processing batch: {e}")
-            continue
+                print(f"  Skipping batch {batch_number} due to embedding error")
     
     print(f"✓ Generated embeddings for {len(documents)} documents")
     return documents
 
 
-def bulk_index_documents(es, documents, index_name='travel_data'):
-    """Bulk index documents to Elasticsearch"""
-    from elasticsearch.helpers import bulk
+def bulk_index_documents(es, documents, index_name='travel_data', thread_count=BULK_THREAD_COUNT, chunk_size=BULK_CHUNK_SIZE):
+    """Bulk index documents to Elasticsearch, sending chunks from several threads
+    
+    Documents get auto-generated _ids (the application id stays in _source),
+    which skips a per-document version lookup. That only suits a freshly
+    created index: re-indexing the same documents adds duplicates instead of
+    overwriting them.
+    """
+    from elasticsearch.helpers import parallel_bulk
     
-    actions = [
+    # Generated lazily so only the chunks in flight exist as bulk actions
+    actions = (
         {
             "_index": index_name,
-            "_id": doc['id'],
             "_source": doc
         }
         for doc in documents
-    ]
+    )
     
     try:
-        success, failed = bulk(es, actions, raise_on_error=False)
+        success, failed = 0, 0
+        for ok, _ in parallel_bulk(
+            es,
+            actions,
+            thread_count=thread_count,
+            chunk_size=chunk_size,
+            max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+            queue_size=thread_count,
+            raise_on_error=False
+        ):
+            if ok:
+                success += 1
+            else:
+                failed += 1
+        
         print(f"✓ Indexed {success} documents successfully")
         if failed:
-            print(f"⚠ Failed to index {len(failed)} documents")
+            print(f"⚠ Failed to index {failed} documents")
         return success
     except Exception as e:
         print(f"✗ Bulk indexing error: {e}")
@@ -108,7 +250,7 @@ def bulk_index_documents(es, documents, index_name='travel_data'):
 
 def run_data_pipeline():
     """Run the complete data loading pipeline"""
-    from modules.elasticsearch_setup import get_elasticsearch_client, create_travel_index
+    from modules.elasticsearch_setup import get_elasticsearch_client, create_travel_index, begin_bulk_load, end_bulk_load
     
     print("\n=== Starting Data Loading Pipeline ===\n")
     
@@ -121,22 +263,19 @@ def run_data_pipeline():
     # Create index
     create_travel_index(es)
     
-    # Load data
-    data = load_all_travel_data()
-    
-    if not data:
-        print("✗ No data to index")
-        return
-    
-    # Generate embeddings
-    documents = prepare_documents_with_embeddings(data)
+    # Load data and generate embeddings (records stream from disk as batches are embedded)
+    documents = asyncio.run(prepare_documents_with_embeddings(load_all_travel_data()))
     
     if not documents:
         print("✗ No documents with embeddings to index")
         return
     
-    # Index to Elasticsearch
-    indexed_count = bulk_index_documents(es, documents)
+    # Index to Elasticsearch with refreshes and replicas paused
+    restore_settings = begin_bulk_load(es)
+    try:
+        indexed_count = bulk_index_documents(es, documents)
+    finally:
+        end_bulk_load(es, 'travel_data', restore_settings)
     
     print(f"\n=== Pipeline Complete: {indexed_count} documents indexed ===\n")
 
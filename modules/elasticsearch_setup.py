@@ -1,12 +1,18 @@
 import os
 import time
+import atexit
+import functools
+import queue
+import threading
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk
 from dotenv import load_dotenv
 
 load_dotenv()
 
+@functools.cache
 def get_elasticsearch_client():
-    """Connect to Elasticsearch with retry logic"""
+    """Connect to Elasticsearch with retry logic; the connected client is shared per process"""
     es_url = os.getenv('ELASTICSEARCH_URL', 'http://localhost:9200')
     es_api_key = os.getenv('ELASTICSEARCH_API_KEY')
     
@@ -15,10 +21,12 @@ def get_elasticsearch_client():
     
     for attempt in range(max_retries):
         try:
+            # Gzip request bodies (bulk loads, vector queries) and retry transient timeouts
+            options = dict(http_compress=True, request_timeout=30, retry_on_timeout=True, max_retries=3)
             if es_api_key:
-                es = Elasticsearch(es_url, api_key=es_api_key)
+                es = Elasticsearch(es_url, api_key=es_api_key, **options)
             else:
-                es = Elasticsearch(es_url)
+                es = Elasticsearch(es_url, **options)
             
             if es.ping():
                 print(f"✓ Connected to Elasticsearch at {es_url}")
@@ -63,7 +71,14 @@ def create_travel_index(es, index_name='travel_data'):
                     "type": "dense_vector",
                     "dims": 768,
                     "index": True,
-                    "similarity": "cosine"
+                    # Vectors are unit-normalized at embedding time, so dot product equals cosine without per-doc norms
+                    "similarity": "dot_product",
+                    # Set EMBEDDING_INDEX_TYPE=int8_hnsw on ES 8.12+ to keep a quarter of the float32 vector bytes in the graph
+                    "index_options": {
+                        "type": os.getenv('EMBEDDING_INDEX_TYPE', 'hnsw'),
+                        "m": 16,
+                        "ef_construction": 100
+                    }
                 },
                 "best_season": {"type": "keyword"},
                 "highlights": {"type": "text"},
@@ -80,6 +95,96 @@ def create_travel_index(es, index_name='travel_data'):
     print(f"✓ Created index '{index_name}' with mappings")
     return True
 
+# Applied while bulk loading: no periodic refreshes, no replica copies, async translog fsync
+BULK_LOAD_SETTINGS = {
+    "refresh_interval": "-1",
+    "number_of_replicas": 0,
+    "translog.durability": "async",
+    "translog.flush_threshold_size": "1gb"
+}
+
+# A single-segment merge of a large index can take many minutes (seconds)
+FORCEMERGE_TIMEOUT = 3600
+
+def begin_bulk_load(es, index_name='travel_data'):
+    """Relax index settings for a bulk load; returns the settings to restore afterwards"""
+    current = es.indices.get_settings(index=index_name, flat_settings=True)[index_name]['settings']
+    restore = {key: current.get(f"index.{key}") for key in BULK_LOAD_SETTINGS}
+    es.indices.put_settings(index=index_name, settings=BULK_LOAD_SETTINGS)
+    return restore
+
+def end_bulk_load(es, index_name, restore):
+    """Restore index settings after a bulk load and merge the new segments"""
+    # None resets a setting to its default
+    es.indices.put_settings(index=index_name, settings=restore)
+    es.indices.refresh(index=index_name)
+    # Not under the client's 30s timeout with retries, which would resend a long-running merge
+    es.options(request_timeout=FORCEMERGE_TIMEOUT, max_retries=0).indices.forcemerge(index=index_name, max_num_segments=1)
+    print(f"✓ Restored settings and merged segments for '{index_name}'")
+
 def check_index_exists(es, index_name='travel_data'):
     """Check if index exists"""
     return es.indices.exists(index=index_name)
+
+
+class IndexBuffer:
+    """Buffers single-document index writes and sends them as bulk requests.
+    
+    A background thread flushes once batch_size documents are queued or
+    every flush_interval seconds. flush() is also registered with atexit so
+    documents still queued at a clean shutdown are sent.
+    """
+    
+    def __init__(self, es, index_name='travel_data', batch_size=500, flush_interval=5.0):
+        self.es = es
+        self.index_name = index_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._wake = threading.Event()
+        self._send_lock = threading.Lock()  # only one flush drains and sends at a time
+        self._thread = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.flush)
+    
+    def index_async(self, doc):
+        """Queue a document for indexing"""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"{self.index_name}-indexer", daemon=True)
+                self._thread.start()
+        
+        self._queue.put({"_index": self.index_name, "_source": doc})
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+    
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+    
+    def flush(self):
+        """Send every queued document now, batch_size actions per bulk request"""
+        with self._send_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+                
+                try:
+                    success, failed = bulk(self.es, batch, raise_on_error=False)
+                    if failed:
+                        print(f"⚠ Failed to index {len(failed)} of {len(batch)} buffered documents")
+                except Exception as e:
+                    print(f"✗ Buffered bulk indexing error: {e}")
+
+@functools.cache
+def get_index_buffer(index_name='travel_data'):
+    """Shared IndexBuffer for event-driven writes to an index"""
+    return IndexBuffer(get_elasticsearch_client(), index_name)
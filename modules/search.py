@@ -1,107 +1,189 @@
 import os
-from vertexai.language_models import TextEmbeddingModel
+import time
+import json
+import hashlib
+import logging
+import threading
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
+from modules.data_loader import get_embedding_model, normalize_vector
+from shared.redis_client import redis_client
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Search results shared across workers (seconds)
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', '3600'))
+
+# Search results kept in this process in front of Redis (seconds); short so a reindex shows up quickly
+LOCAL_SEARCH_CACHE_TTL = int(os.getenv('LOCAL_SEARCH_CACHE_TTL', '60'))
+
+# Type-specific fields copied into a result only when present
+OPTIONAL_RESULT_FIELDS = ('highlights', 'amenities', 'cuisine', 'specialties', 'duration_hours', 'best_time')
+
+# Everything format_search_results reads; the 768-float embedding is never shipped back
+RESULT_SOURCE_FIELDS = ['id', 'type', 'name', 'description', 'location', 'price_range', 'rating', 'categories', *OPTIONAL_RESULT_FIELDS]
+
+# Fields the keyword half of every query matches against
+KEYWORD_FIELDS = ["name^3", "description^2", "highlights", "specialties"]
+
+
+class CircuitBreaker:
+    """Skips calls to a failing dependency for a cool-down that doubles per
+    consecutive failure (2, 4, 8 ... max_backoff seconds)"""
+    
+    def __init__(self, max_backoff=60):
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.open_until = 0.0
+    
+    def allow(self):
+        return time.monotonic() >= self.open_until
+    
+    def record_success(self):
+        self.failures = 0
+    
+    def record_failure(self):
+        self.failures += 1
+        self.open_until = time.monotonic() + min(self.max_backoff, 2 ** self.failures)
+
+
+# While open, searches go straight to keyword-only instead of waiting on Vertex AI
+embedding_circuit = CircuitBreaker()
+
 def get_query_embedding(text, model_name='text-embedding-004'):
     """Generate embedding for search query"""
+    if not embedding_circuit.allow():
+        return None
     try:
-        model = TextEmbeddingModel.from_pretrained(model_name)
-        embeddings = model.get_embeddings([text])
-        return embeddings[0].values
-    except Exception as e:
-        print(f"Error generating query embedding: {e}")
+        embeddings = get_embedding_model(model_name).get_embeddings([text])
+        embedding_circuit.record_success()
+        return normalize_vector(embeddings[0].values)
+    except Exception:
+        embedding_circuit.record_failure()
+        logger.exception("Error generating query embedding")
         return None
 
+def get_query_embeddings(texts, model_name='text-embedding-004'):
+    """Generate embeddings for several search queries in one request"""
+    if not embedding_circuit.allow():
+        return [None] * len(texts)
+    try:
+        embeddings = get_embedding_model(model_name).get_embeddings(texts)
+        embedding_circuit.record_success()
+        return [normalize_vector(emb.values) for emb in embeddings]
+    except Exception:
+        embedding_circuit.record_failure()
+        logger.exception("Error generating query embeddings")
+        return [None] * len(texts)
+
+def build_filter_clauses(filters):
+    """Build exact-match filter clauses (filter context: unscored and cacheable)"""
+    filter_clauses = []
+    if not filters:
+        return filter_clauses
+    
+    if 'price_range' in filters:
+        filter_clauses.append({"term": {"price_range": filters['price_range']}})
+    
+    if 'categories' in filters:
+        filter_clauses.append({"terms": {"categories": filters['categories']}})
+    
+    if 'type' in filters:
+        filter_clauses.append({"term": {"type": filters['type']}})
+    
+    if 'city' in filters:
+        filter_clauses.append({"term": {"location.city": filters['city']}})
+    
+    if 'country' in filters:
+        filter_clauses.append({"term": {"location.country": filters['country']}})
+    
+    return filter_clauses
+
 def build_hybrid_search_query(query_text, query_embedding, filters=None, size=10):
     """Build Elasticsearch hybrid search query combining keyword and vector search"""
+    filter_clauses = build_filter_clauses(filters)
     
     # Build the query with both keyword and vector search
     query = {
         "size": size,
+        # Keyword search
         "query": {
             "bool": {
                 "should": [
-                    # Keyword search
                     {
                         "multi_match": {
                             "query": query_text,
-                            "fields": ["name^3", "description^2", "highlights", "specialties"],
+                            "fields": KEYWORD_FIELDS,
                             "type": "best_fields",
                             "boost": 1.0
                         }
-                    },
-                    # Vector similarity search
-                    {
-                        "script_score": {
-                            "query": {"match_all": {}},
-                            "script": {
-                                "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
-                                "params": {"query_vector": query_embedding}
-                            },
-                            "boost": 1.0
-                        }
                     }
-                ],
-                "minimum_should_match": 1
+                ]
             }
+        },
+        # Vector similarity search (approximate kNN on the HNSW-indexed embedding field)
+        "knn": {
+            "field": "embedding",
+            "query_vector": query_embedding,
+            "k": size,
+            "num_candidates": max(size * 10, 100),
+            "boost": 1.0
         }
     }
     
-    # Add filters if provided
-    if filters:
-        filter_clauses = []
-        
-        if 'price_range' in filters:
-            filter_clauses.append({"term": {"price_range": filters['price_range']}})
-        
-        if 'categories' in filters:
-            filter_clauses.append({"terms": {"categories": filters['categories']}})
-        
-        if 'type' in filters:
-            filter_clauses.append({"term": {"type": filters['type']}})
-        
-        if 'city' in filters:
-            filter_clauses.append({"term": {"location.city": filters['city']}})
-        
-        if 'country' in filters:
-            filter_clauses.append({"term": {"location.country": filters['country']}})
-        
-        if filter_clauses:
-            query["query"]["bool"]["filter"] = filter_clauses
+    # Add filters if provided; kNN takes its own filter so candidates are filtered before top-k
+    if filter_clauses:
+        query["query"]["bool"]["filter"] = filter_clauses
+        query["knn"]["filter"] = filter_clauses
     
     return query
 
+def build_search_query(query_text, query_embedding, filters=None, size=10):
+    """Build a hybrid query, or a keyword-only query when no embedding is available"""
+    if not query_embedding:
+        logger.warning("Could not generate embedding, falling back to keyword search only")
+        # Fallback to keyword-only search
+        return {
+            "size": size,
+            "_source": RESULT_SOURCE_FIELDS,
+            "query": {
+                "bool": {
+                    "must": {
+                        "multi_match": {
+                            "query": query_text,
+                            "fields": KEYWORD_FIELDS
+                        }
+                    },
+                    "filter": build_filter_clauses(filters)
+                }
+            }
+        }
+    
+    # Build hybrid search query
+    query = build_hybrid_search_query(query_text, query_embedding, filters, size)
+    query["_source"] = RESULT_SOURCE_FIELDS
+    return query
 
 def execute_search(es, query_text, filters=None, index_name='travel_data', size=10):
-    """Execute hybrid search against Elasticsearch"""
+    """Execute hybrid search against Elasticsearch.
+    
+    Returns (response, hybrid); hybrid is False when no embedding was available
+    and the search fell back to keyword-only.
+    """
     try:
         # Generate query embedding
         query_embedding = get_query_embedding(query_text)
+        query = build_search_query(query_text, query_embedding, filters, size)
         
-        if not query_embedding:
-            print("Warning: Could not generate embedding, falling back to keyword search only")
-            # Fallback to keyword-only search
-            query = {
-                "size": size,
-                "query": {
-                    "multi_match": {
-                        "query": query_text,
-                        "fields": ["name^3", "description^2", "highlights", "specialties"]
-                    }
-                }
-            }
-        else:
-            # Build hybrid search query
-            query = build_hybrid_search_query(query_text, query_embedding, filters, size)
-        
-        # Execute search
-        response = es.search(index=index_name, body=query)
-        return response
+        # Execute search (request_cache lets shards reuse results for repeated queries)
+        response = es.search(index=index_name, body=query, request_cache=True)
+        return response, query_embedding is not None
         
-    except Exception as e:
-        print(f"Search error: {e}")
+    except Exception:
+        logger.exception("Search error")
         raise
 
 def format_search_results(response):
@@ -128,36 +210,113 @@ def format_search_results(response):
         }
         
         # Add type-specific fields
-        if source.get('highlights'):
-            result['highlights'] = source['highlights']
-        if source.get('amenities'):
-            result['amenities'] = source['amenities']
-        if source.get('cuisine'):
-            result['cuisine'] = source['cuisine']
-        if source.get('specialties'):
-            result['specialties'] = source['specialties']
-        if source.get('duration_hours'):
-            result['duration_hours'] = source['duration_hours']
-        if source.get('best_time'):
-            result['best_time'] = source['best_time']
+        result.update({field: source[field] for field in OPTIONAL_RESULT_FIELDS if source.get(field)})
         
         formatted_results.append(result)
     
     return formatted_results
 
+def freeze_filters(filters):
+    """Turn a filters dict into a hashable, order-independent key"""
+    return tuple(sorted(
+        (key, tuple(value) if isinstance(value, list) else value)
+        for key, value in (filters or {}).items()
+    ))
+
+def search_cache_key(query_text, frozen_filters, size):
+    """Redis key for a normalized (query, filters, size) search"""
+    payload = json.dumps([query_text, frozen_filters, size])
+    return f"search:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+# Keyed by the Redis cache key; TTLCache isn't thread-safe, so access goes through the lock
+local_search_cache = TTLCache(maxsize=2048, ttl=LOCAL_SEARCH_CACHE_TTL)
+local_search_cache_lock = threading.Lock()
+
+def cached_search(es, query_text, frozen_filters, size):
+    """Execute and format a search; repeated (query, filters, size) lookups are served from
+    memory, then from Redis, before paying for an embedding and an Elasticsearch round trip"""
+    cache_key = search_cache_key(query_text, frozen_filters, size)
+    with local_search_cache_lock:
+        results = local_search_cache.get(cache_key)
+    if results is not None:
+        return results
+    
+    results = None
+    try:
+        cached = redis_client.get(cache_key)
+        if cached is not None:
+            results = tuple(cached)
+    except Exception as e:
+        logger.warning("Search cache unavailable: %s", e)
+    
+    if results is None:
+        filters = {key: list(value) if isinstance(value, tuple) else value for key, value in frozen_filters}
+        response, hybrid = execute_search(es, query_text, filters or None, size=size)
+        results = tuple(format_search_results(response))
+        
+        # Keyword-only fallbacks (Vertex AI down) aren't cached, so hybrid search resumes with the circuit
+        if not hybrid:
+            return results
+        
+        try:
+            redis_client.set(cache_key, results, ttl=SEARCH_CACHE_TTL)
+        except Exception as e:
+            logger.warning("Failed to cache search results: %s", e)
+    
+    with local_search_cache_lock:
+        local_search_cache[cache_key] = results
+    return results
+
 def search_travel_data(es, query_text, filters=None, size=10):
     """Main search function - execute and format results"""
     try:
-        response = execute_search(es, query_text, filters, size=size)
-        results = format_search_results(response)
+        normalized_query = ' '.join(query_text.lower().split())
+        # Copy cached results so callers can't mutate the cache
+        results = [dict(result) for result in cached_search(es, normalized_query, freeze_filters(filters), size)]
         
         if not results:
-            print(f"No results found for query: {query_text}")
+            logger.info("No results found for query: %s", query_text)
         else:
-            print(f"Found {len(results)} results for query: {query_text}")
+            logger.debug("Found %d results for query: %s", len(results), query_text)
         
         return results
         
-    except Exception as e:
-        print(f"Error in search_travel_data: {e}")
+    except Exception:
+        logger.exception("Error in search_travel_data")
         return []
+
+def search_travel_data_multi(es, queries, index_name='travel_data', source_fields=None):
+    """Run several searches in a single msearch round trip.
+    
+    queries is a list of (query_text, filters, size) tuples; returns one
+    formatted result list per query, in the same order. source_fields limits
+    the _source fields Elasticsearch returns for every query.
+    """
+    try:
+        embeddings = get_query_embeddings([query_text for query_text, _, _ in queries])
+        
+        searches = []
+        for (query_text, filters, size), embedding in zip(queries, embeddings):
+            query = build_search_query(query_text, embedding, filters, size)
+            if source_fields:
+                query["_source"] = list(source_fields)
+            searches.append({"index": index_name, "request_cache": True})
+            searches.append(query)
+        
+        response = es.msearch(searches=searches)
+        
+        all_results = []
+        for (query_text, _, _), item in zip(queries, response['responses']):
+            if 'error' in item:
+                logger.error("Search error for query '%s': %s", query_text, item['error'])
+                all_results.append([])
+            else:
+                results = format_search_results(item)
+                logger.debug("Found %d results for query: %s", len(results), query_text)
+                all_results.append(results)
+        
+        return all_results
+        
+    except Exception:
+        logger.exception("Error in search_travel_data_multi")
+        return [[] for _ in queries]
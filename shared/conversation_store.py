@@ -0,0 +1,67 @@
+"""
+Redis-backed chat conversation state
+"""
+import os
+from typing import Any, Dict, List
+from .redis_client import redis_client
+
+# Messages rendered into the prompt's CONVERSATION HISTORY section
+PROMPT_HISTORY_MESSAGES = 4
+
+
+def format_history_line(message: Dict[str, Any]) -> str:
+    """Render one message the way it appears in the prompt history"""
+    return f"{message.get('role', 'user').upper()}: {message.get('content', '')}\n"
+
+
+class ConversationStore:
+    """Stores chat history and extracted preferences per conversation_id.
+    
+    Preferences live in a hash at conv:{id} and messages in a capped list at
+    conv:{id}:msgs, so state is shared across workers and expires when idle.
+    The last PROMPT_HISTORY_MESSAGES messages are also kept pre-rendered at
+    conv:{id}:prompt so each turn reads a few ready lines instead of
+    decoding and reformatting the whole history.
+    """
+    
+    def __init__(self):
+        self.ttl = int(os.getenv('CONVERSATION_TTL', '3600'))
+        self.max_messages = int(os.getenv('CONVERSATION_MAX_MESSAGES', '50'))
+    
+    def _key(self, conversation_id: str) -> str:
+        return f"conv:{conversation_id}"
+    
+    def get_messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Get the stored message history"""
+        return redis_client.get_list(f"{self._key(conversation_id)}:msgs")
+    
+    def get_history_text(self, conversation_id: str) -> str:
+        """Get the rendered prompt history for the most recent messages"""
+        return ''.join(redis_client.get_list(f"{self._key(conversation_id)}:prompt"))
+    
+    def get_preferences(self, conversation_id: str) -> Dict[str, Any]:
+        """Get accumulated user preferences"""
+        return redis_client.get_hash(self._key(conversation_id)) or {}
+    
+    def update_preferences(self, conversation_id: str, preferences: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge new preferences, refresh the TTL and return the full set"""
+        return redis_client.update_hash(self._key(conversation_id), preferences, ttl=self.ttl)
+    
+    def append_messages(self, conversation_id: str, messages: List[Dict[str, Any]]):
+        """Append messages, keeping only the most recent max_messages"""
+        redis_client.push_list(
+            f"{self._key(conversation_id)}:msgs",
+            messages,
+            max_length=self.max_messages,
+            ttl=self.ttl
+        )
+        redis_client.push_list(
+            f"{self._key(conversation_id)}:prompt",
+            [format_history_line(message) for message in messages],
+            max_length=PROMPT_HISTORY_MESSAGES,
+            ttl=self.ttl
+        )
+
+
+# Global instance
+conversation_store = ConversationStore()
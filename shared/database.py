@@ -1,10 +1,12 @@
 """
 Database models and connection management
 """
-from sqlalchemy import create_engine, Column, String, Float, DateTime, JSON, Enum as SQLEnum, Integer, Boolean, ForeignKey
+from sqlalchemy import create_engine, update, Column, String, Float, DateTime, JSON, Enum as SQLEnum, Integer, Boolean, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from datetime import datetime, timezone
+import functools
 import os
 import enum
 
@@ -125,6 +127,28 @@ class AgentState(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+def utc_datetime_from_ns(timestamp_ns: int) -> datetime:
+    """Convert an epoch-nanosecond timestamp to the naive UTC datetime stored in DateTime columns"""
+    return datetime.fromtimestamp(timestamp_ns / 1_000_000_000, timezone.utc).replace(tzinfo=None)
+
+
+def confirm_paid_bookings(session, payments):
+    """Mark the bookings referenced by newly inserted payment rows as confirmed.
+    
+    Runs inside the caller's transaction so the payment insert and booking
+    confirmation commit together.
+    """
+    booking_ids = {p["booking_id"] for p in payments if p.get("booking_id")}
+    if not booking_ids:
+        return
+    session.execute(
+        update(Booking)
+        .where(Booking.id.in_(booking_ids))
+        .where(Booking.status == BookingStatus.PENDING)
+        .values(status=BookingStatus.CONFIRMED, confirmed_at=datetime.utcnow())
+    )
+
+
 # Database connection management
 def get_database_url():
     """Get database URL from environment"""
@@ -136,20 +160,68 @@ def get_database_url():
 
 def create_db_engine():
     """Create database engine"""
-    return create_engine(get_database_url(), echo=False)
+    return create_engine(
+        get_database_url(),
+        echo=False,
+        pool_size=10,
+        max_overflow=20,
+        pool_timeout=30,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+        pool_use_lifo=True  # reuse the most recently returned connection; idle extras can time out
+    )
+
+
+@functools.cache
+def get_engine():
+    """Get the process-wide database engine, created on first use"""
+    return create_db_engine()
+
+
+@functools.cache
+def get_session_factory():
+    """Get the session factory bound to the shared engine"""
+    return sessionmaker(bind=get_engine())
 
 
 def get_session():
-    """Get database session"""
-    engine = create_db_engine()
-    Session = sessionmaker(bind=engine)
-    return Session()
+    """Get database session from the shared connection pool"""
+    return get_session_factory()()
+
+
+def get_async_database_url():
+    """Get database URL for the asyncpg driver"""
+    url = get_database_url()
+    if url.startswith('postgresql://'):
+        url = 'postgresql+asyncpg://' + url[len('postgresql://'):]
+    return url
+
+
+_async_session_factory = None
+
+
+def get_async_session():
+    """Get an async database session backed by a shared connection pool.
+    
+    Use as ``async with get_async_session() as session``. Pooled connections are
+    tied to the event loop that opened them, so use this from long-lived agent
+    loops rather than per-request loops.
+    """
+    global _async_session_factory
+    if _async_session_factory is None:
+        engine = create_async_engine(
+            get_async_database_url(),
+            pool_size=20,
+            max_overflow=40,
+            pool_pre_ping=True
+        )
+        _async_session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    return _async_session_factory()
 
 
 def init_database():
     """Initialize database tables"""
-    engine = create_db_engine()
-    Base.metadata.create_all(engine)
+    Base.metadata.create_all(get_engine())
     print("✓ Database tables created")
 
 
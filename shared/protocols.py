@@ -31,11 +31,7 @@ class A2AMessage(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     payload: Dict[str, Any] = Field(..., description="Message payload")
     context: Optional[Dict[str, Any]] = Field(default=None, description="Shared context")
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
+    in_reply_to: Optional[str] = Field(default=None, description="message_id of the request being answered")
 
 
 class A2ARequest(A2AMessage):
@@ -53,6 +49,18 @@ class A2AResponse(A2AMessage):
     error: Optional[str] = Field(default=None)
 
 
+A2A_MESSAGE_CLASSES = {
+    MessageType.REQUEST: A2ARequest,
+    MessageType.RESPONSE: A2AResponse,
+}
+
+
+def parse_a2a_message(data: Dict[str, Any]) -> A2AMessage:
+    """Parse a decoded wire message into its concrete A2A class"""
+    model = A2A_MESSAGE_CLASSES.get(data.get("message_type"), A2AMessage)
+    return model.model_validate(data)
+
+
 # ============================================================================
 # AP2 Protocol (Agent Payment Protocol)
 # ============================================================================
@@ -115,11 +123,6 @@ class AP2PaymentResponse(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     receipt_url: Optional[str] = Field(default=None)
     error: Optional[str] = Field(default=None)
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
 
 
 # ============================================================================
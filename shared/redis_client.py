@@ -2,9 +2,23 @@
 Redis client for caching and state management
 """
 import redis
-import json
+import orjson
 import os
-from typing import Any, Optional
+import uuid
+from typing import Any, List, Optional
+
+# Compare-and-delete, atomically on the server
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def dumps(value: Any) -> bytes:
+    """Serialize a value for storage"""
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
 
 
 class RedisClient:
@@ -12,11 +26,13 @@ class RedisClient:
     
     def __init__(self):
         redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
-        self.client = redis.from_url(redis_url, decode_responses=True)
+        max_connections = int(os.getenv('REDIS_MAX_CONNECTIONS', '20'))
+        self.pool = redis.ConnectionPool.from_url(redis_url, max_connections=max_connections, decode_responses=True)
+        self.client = redis.Redis(connection_pool=self.pool)
     
     def set(self, key: str, value: Any, ttl: Optional[int] = None):
         """Set a value with optional TTL (seconds)"""
-        serialized = json.dumps(value)
+        serialized = dumps(value)
         if ttl:
             self.client.setex(key, ttl, serialized)
         else:
@@ -26,9 +42,37 @@ class RedisClient:
         """Get a value"""
         value = self.client.get(key)
         if value:
-            return json.loads(value)
+            return orjson.loads(value)
         return None
     
+    def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Get several values in one round trip (None for missing keys)"""
+        if not keys:
+            return []
+        return [orjson.loads(value) if value else None for value in self.client.mget(keys)]
+    
+    def mset(self, mapping: dict, ttl: Optional[int] = None):
+        """Set several values with optional TTL (seconds) in one round trip"""
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            if ttl:
+                pipe.setex(key, ttl, dumps(value))
+            else:
+                pipe.set(key, dumps(value))
+        pipe.execute()
+    
+    def acquire_lock(self, key: str, ttl: int) -> Optional[str]:
+        """Take a simple cross-process lock (SET NX); it expires after ttl seconds if never released.
+        
+        Returns the token to pass to release_lock, or None if the lock is held elsewhere.
+        """
+        token = uuid.uuid4().hex
+        return token if self.client.set(key, token, nx=True, ex=ttl) else None
+    
+    def release_lock(self, key: str, token: str):
+        """Release a lock only if it is still held with this token (it may have expired and been re-taken)"""
+        self.client.eval(RELEASE_LOCK_SCRIPT, 1, key, token)
+    
     def delete(self, key: str):
         """Delete a key"""
         self.client.delete(key)
@@ -37,18 +81,66 @@ class RedisClient:
         """Check if key exists"""
         return self.client.exists(key) > 0
     
-    def set_hash(self, key: str, mapping: dict):
-        """Set a hash"""
-        serialized = {k: json.dumps(v) for k, v in mapping.items()}
-        self.client.hset(key, mapping=serialized)
+    def expire(self, key: str, ttl: int):
+        """Set a key's TTL (seconds)"""
+        self.client.expire(key, ttl)
+    
+    def set_hash(self, key: str, mapping: dict, ttl: Optional[int] = None):
+        """Set hash fields with optional TTL (seconds)"""
+        serialized = {k: dumps(v) for k, v in mapping.items()}
+        pipe = self.client.pipeline()
+        pipe.hset(key, mapping=serialized)
+        if ttl:
+            pipe.expire(key, ttl)
+        pipe.execute()
+    
+    def update_hash(self, key: str, mapping: dict, ttl: Optional[int] = None) -> dict:
+        """Merge fields into a hash and return the full hash in one round trip"""
+        pipe = self.client.pipeline()
+        if mapping:
+            pipe.hset(key, mapping={k: dumps(v) for k, v in mapping.items()})
+        if ttl:
+            pipe.expire(key, ttl)
+        pipe.hgetall(key)
+        data = pipe.execute()[-1]
+        return {k: orjson.loads(v) for k, v in data.items()}
     
     def get_hash(self, key: str) -> Optional[dict]:
         """Get a hash"""
         data = self.client.hgetall(key)
         if data:
-            return {k: json.loads(v) for k, v in data.items()}
+            return {k: orjson.loads(v) for k, v in data.items()}
         return None
     
+    def push_list(self, key: str, values: List[Any], max_length: Optional[int] = None, ttl: Optional[int] = None):
+        """Append values to a list, keeping only the last max_length items"""
+        pipe = self.client.pipeline()
+        pipe.rpush(key, *[dumps(v) for v in values])
+        if max_length:
+            pipe.ltrim(key, -max_length, -1)
+        if ttl:
+            pipe.expire(key, ttl)
+        pipe.execute()
+    
+    def remove_from_list(self, key: str, values: List[Any]):
+        """Remove every occurrence of each value from a list"""
+        self.remove_raw_from_list(key, [dumps(value) for value in values])
+    
+    def remove_raw_from_list(self, key: str, raw_values: List[Any]):
+        """Remove every occurrence of each stored (serialized) item from a list"""
+        pipe = self.client.pipeline()
+        for raw_value in raw_values:
+            pipe.lrem(key, 0, raw_value)
+        pipe.execute()
+    
+    def get_list(self, key: str) -> List[Any]:
+        """Get all items of a list"""
+        return [orjson.loads(v) for v in self.client.lrange(key, 0, -1)]
+    
+    def get_list_raw(self, key: str) -> List[str]:
+        """Get all items of a list as stored, without deserializing"""
+        return self.client.lrange(key, 0, -1)
+    
     def ping(self) -> bool:
         """Check connection"""
         try:
@@ -0,0 +1,205 @@
+"""
+Write-behind queue for persisting ORM rows off the request path
+"""
+import logging
+import orjson
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import DateTime
+from sqlalchemy.exc import InterfaceError, OperationalError
+from .database import get_session, utc_datetime_from_ns
+from .redis_client import dumps, redis_client
+
+logger = logging.getLogger(__name__)
+
+# Attempts to commit a batch before leaving it to recover(), with backoff between them (seconds)
+FLUSH_ATTEMPTS = 8
+RETRY_INITIAL_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# Upper bound on how long one process holds the WAL recovery lock (seconds)
+RECOVER_LOCK_TTL = 300
+
+
+def is_transient(error: Exception) -> bool:
+    """Connection-level database failures are worth retrying; constraint and data errors fail the same way every time"""
+    return isinstance(error, (OperationalError, InterfaceError))
+
+
+class WriteBehindQueue:
+    """Buffers inserts for one model and flushes them in batches.
+    
+    Each row is first recorded in a Redis list (the write-ahead log) and only
+    removed once its batch has committed, so rows queued when the process
+    dies are replayed by recover() on the next start. A batch that fails to
+    commit because the database is unreachable is retried with backoff
+    before being left to recover(); a batch rejected for its data is
+    written row by row, and rows that still fail are moved to a dead-letter
+    list (wal_key + ":dead") so they can't block the rest. Flushing runs on its
+    own thread because Flask async views use a short-lived event loop per
+    request, which would take an asyncio consumer down with it.
+    """
+    
+    def __init__(self, model, wal_key: str, batch_size: int = 100, flush_interval: float = 0.05,
+                 after_insert: Optional[Callable[[Any, List[Dict[str, Any]]], None]] = None):
+        self.model = model
+        self.wal_key = wal_key
+        self.dead_letter_key = f"{wal_key}:dead"
+        self.after_insert = after_insert  # extra writes committed in the same transaction
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._datetime_columns = {
+            column.name for column in model.__table__.columns if isinstance(column.type, DateTime)
+        }
+    
+    def _to_wal(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v.isoformat() if isinstance(v, datetime) else v for k, v in row.items()}
+    
+    def _to_columns(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert epoch-ns ints and ISO strings to datetimes for DateTime columns"""
+        values = dict(row)
+        for name in self._datetime_columns.intersection(values):
+            value = values[name]
+            if isinstance(value, int):
+                values[name] = utc_datetime_from_ns(value)
+            elif isinstance(value, str):
+                values[name] = datetime.fromisoformat(value)
+        return values
+    
+    def put(self, row: Dict[str, Any]):
+        """Queue a row (column name -> value) for insertion.
+        
+        DateTime columns may be given as epoch-nanosecond ints; they are
+        converted on the writer thread.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f"{self.wal_key}-writer",
+                    daemon=True
+                )
+                self._thread.start()
+        
+        wal_entry = self._to_wal(row)
+        redis_client.push_list(self.wal_key, [wal_entry])
+        # Entries are removed from the WAL by their stored form
+        self._queue.put((row, dumps(wal_entry)))
+    
+    def _run(self):
+        """Drain the queue, committing up to batch_size rows per flush_interval"""
+        while True:
+            batch = [self._queue.get()]
+            time.sleep(self.flush_interval)
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            self._flush_with_retry(batch)
+    
+    def _flush_with_retry(self, batch: List[tuple], attempts: int = FLUSH_ATTEMPTS, merge: bool = False) -> int:
+        """Flush a batch, retrying with backoff while the database is unreachable.
+        
+        Retries merge rows by primary key instead of inserting them, so rows
+        that already committed (e.g. replayed by another process's recover())
+        don't fail the batch again. Returns the number of rows persisted.
+        """
+        delay = RETRY_INITIAL_DELAY
+        for attempt in range(1, attempts + 1):
+            try:
+                self._flush(batch, merge=merge or attempt > 1)
+                return len(batch)
+            except Exception as e:
+                if not is_transient(e):
+                    logger.warning("%d %s rows rejected as a batch, writing them one at a time: %s",
+                                   len(batch), self.model.__tablename__, e)
+                    return self._flush_rows(batch)
+                if attempt == attempts:
+                    # Rows stay in the WAL and are replayed by recover()
+                    logger.error("Giving up on %d %s rows after %d attempts: %s",
+                                 len(batch), self.model.__tablename__, attempt, e)
+                    return 0
+                logger.warning("Failed to persist %d %s rows, retrying in %gs: %s",
+                               len(batch), self.model.__tablename__, delay, e)
+                time.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+        return 0
+    
+    def _flush_rows(self, batch: List[tuple]) -> int:
+        """Write rows in their own transactions, dead-lettering the ones the database rejects"""
+        persisted = 0
+        for item in batch:
+            try:
+                self._flush([item], merge=True)
+                persisted += 1
+            except Exception as e:
+                if is_transient(e):
+                    logger.error("Failed to persist a %s row, leaving it in the WAL: %s", self.model.__tablename__, e)
+                else:
+                    self._dead_letter(item, e)
+        return persisted
+    
+    def _dead_letter(self, item: tuple, error: Exception):
+        """Move a row that can never commit out of the WAL"""
+        _, raw_entry = item
+        redis_client.push_list(self.dead_letter_key, [{"entry": orjson.loads(raw_entry), "error": str(error)}])
+        redis_client.remove_raw_from_list(self.wal_key, [raw_entry])
+        logger.error("Moved a %s row to %s: %s", self.model.__tablename__, self.dead_letter_key, error)
+    
+    def _write(self, session, rows: List[Dict[str, Any]], merge: bool):
+        if merge:
+            # merge() is keyed on the primary key, so rows that did commit are not duplicated
+            for row in rows:
+                session.merge(self.model(**row))
+        else:
+            session.bulk_insert_mappings(self.model, rows)
+        if self.after_insert:
+            self.after_insert(session, rows)
+    
+    def _flush(self, batch: List[tuple], merge: bool = False):
+        """Insert a batch in a single transaction, then drop it from the WAL"""
+        rows = [self._to_columns(row) for row, _ in batch]
+        session = get_session()
+        try:
+            self._write(session, rows, merge)
+            session.commit()
+        finally:
+            session.close()
+        
+        redis_client.remove_raw_from_list(self.wal_key, [raw_entry for _, raw_entry in batch])
+        logger.info("✓ Persisted %d %s rows", len(batch), self.model.__tablename__)
+    
+    def recover(self) -> int:
+        """Replay rows left in the WAL by a previous process.
+        
+        Guarded by a Redis lock so that processes starting together don't
+        replay the same entries concurrently. Rows the database rejects are
+        dead-lettered like on the writer thread.
+        """
+        lock_key = f"{self.wal_key}:recover_lock"
+        token = redis_client.acquire_lock(lock_key, ttl=RECOVER_LOCK_TTL)
+        if token is None:
+            logger.info("Skipping %s recovery; another process is already replaying it", self.wal_key)
+            return 0
+        
+        try:
+            # Entries are removed by their stored form, so rows written with an older encoding still clear
+            raw_entries = redis_client.get_list_raw(self.wal_key)
+            if not raw_entries:
+                return 0
+            
+            batch = [(orjson.loads(raw_entry), raw_entry) for raw_entry in raw_entries]
+            recovered = self._flush_with_retry(batch, attempts=1, merge=True)
+            logger.info("✓ Recovered %d of %d %s rows from %s",
+                        recovered, len(raw_entries), self.model.__tablename__, self.wal_key)
+            return recovered
+        finally:
+            redis_client.release_lock(lock_key, token)
@@ -2,47 +2,75 @@
 Test script for v2.0 features
 """
 import asyncio
+import io
+import os
 import sys
+import traceback
+
+import orjson
 
 # Add current directory to path
 sys.path.insert(0, '.')
 
-from agents.flight_agent import flight_agent
-from agents.payment_agent import payment_agent
-from agents.orchestrator import orchestrator
+from agents.flight_agent import get_flight_agent
+from agents.payment_agent import get_payment_agent
+from agents.orchestrator import get_orchestrator
+
+flight_agent = get_flight_agent()
+payment_agent = get_payment_agent()
+orchestrator = get_orchestrator()
+
+# DEBUG=1 also dumps the raw agent responses
+DEBUG = os.getenv("DEBUG") == "1"
+
+
+class TestLogger:
+    """Buffers one test's output so it is written in a single call once the test finishes"""
+    
+    def __init__(self):
+        self.buffer = io.StringIO()
+    
+    def log(self, msg: str = ""):
+        self.buffer.write(f"{msg}\n")
+    
+    def dump(self, result):
+        if DEBUG:
+            self.log(orjson.dumps(result, option=orjson.OPT_INDENT_2, default=str).decode())
 
 
-async def test_flight_search():
+async def test_flight_search(log: TestLogger):
     """Test flight search"""
-    print("\n" + "="*60)
-    print("TEST 1: Flight Search")
-    print("="*60)
+    log.log("\n" + "="*60)
+    log.log("TEST 1: Flight Search")
+    log.log("="*60)
     
-    result = await flight_agent.search_flights(
-        parameters={
-            "origin": "SFO",
-            "destination": "NRT",
-            "date": "2025-12-01",
-            "passengers": 2
-        }
-    )
+    queries = [
+        {"origin": "SFO", "destination": "NRT", "date": "2025-12-01", "passengers": 2},
+        {"origin": "LAX", "destination": "JFK", "date": "2025-11-15", "passengers": 1},
+    ]
+    
+    # One batched call serves every route: a single cache round trip, concurrent searches for the misses
+    results = await flight_agent.search_flights_batch(queries)
+    assert len(results) == len(queries), f"Expected {len(queries)} results, got {len(results)}"
+    log.dump(results)
     
-    print(f"\n✓ Found {result['count']} flights")
-    if result['flights']:
-        flight = result['flights'][0]
-        print(f"\nCheapest Flight:")
-        print(f"  Airline: {flight['airline']}")
-        print(f"  Flight: {flight['flight_number']}")
-        print(f"  Price: ${flight['price']['amount']} ({flight['price']['per_person']}/person)")
-        print(f"  Duration: {flight['duration_minutes']} minutes")
-        print(f"  Stops: {flight['stops']}")
+    for query, result in zip(queries, results):
+        log.log(f"\n✓ {query['origin']} → {query['destination']}: found {result['count']} flights")
+        if result['flights']:
+            flight = result['flights'][0]
+            log.log(f"  Cheapest Flight:")
+            log.log(f"    Airline: {flight['airline']}")
+            log.log(f"    Flight: {flight['flight_number']}")
+            log.log(f"    Price: ${flight['price']['amount']} ({flight['price']['per_person']}/person)")
+            log.log(f"    Duration: {flight['duration_minutes']} minutes")
+            log.log(f"    Stops: {flight['stops']}")
 
 
-async def test_payment_processing():
+async def test_payment_processing(log: TestLogger):
     """Test payment processing with AP2"""
-    print("\n" + "="*60)
-    print("TEST 2: Payment Processing (AP2 Protocol)")
-    print("="*60)
+    log.log("\n" + "="*60)
+    log.log("TEST 2: Payment Processing (AP2 Protocol)")
+    log.log("="*60)
     
     result = await payment_agent.process_payment(
         parameters={
@@ -60,23 +88,24 @@ async def test_payment_processing():
             }
         }
     )
+    log.dump(result)
     
-    print(f"\n✓ Payment Status: {result.get('status', 'unknown')}")
-    print(f"  Payment ID: {result.get('payment_id', 'N/A')}")
-    print(f"  Transaction ID: {result.get('transaction_id', 'N/A')}")
+    log.log(f"\n✓ Payment Status: {result.get('status', 'unknown')}")
+    log.log(f"  Payment ID: {result.get('payment_id', 'N/A')}")
+    log.log(f"  Transaction ID: {result.get('transaction_id', 'N/A')}")
     
     if 'amount' in result:
-        print(f"  Amount: ${result['amount']['value']} {result['amount']['currency']}")
-        print(f"  Receipt: {result.get('receipt_url', 'N/A')}")
+        log.log(f"  Amount: ${result['amount']['value']} {result['amount']['currency']}")
+        log.log(f"  Receipt: {result.get('receipt_url', 'N/A')}")
     elif 'error' in result:
-        print(f"  Note: Payment processed but not persisted (no booking_id)")
+        log.log(f"  Note: Payment processed but not persisted (no booking_id)")
 
 
-async def test_orchestrator_workflow():
+async def test_orchestrator_workflow(log: TestLogger):
     """Test orchestrator workflow"""
-    print("\n" + "="*60)
-    print("TEST 3: Orchestrator Workflow")
-    print("="*60)
+    log.log("\n" + "="*60)
+    log.log("TEST 3: Orchestrator Workflow")
+    log.log("="*60)
     
     result = await orchestrator.book_flight_only(
         parameters={
@@ -86,17 +115,18 @@ async def test_orchestrator_workflow():
             "passengers": 1
         }
     )
+    log.dump(result)
     
-    print(f"\n✓ Workflow Status: {result.get('status')}")
-    print(f"  Workflow ID: {result.get('workflow_id')}")
-    print(f"  Steps Completed: {result.get('steps_completed')}")
+    log.log(f"\n✓ Workflow Status: {result.get('status')}")
+    log.log(f"  Workflow ID: {result.get('workflow_id')}")
+    log.log(f"  Steps Completed: {result.get('steps_completed')}")
 
 
-async def test_agent_status():
+async def test_agent_status(log: TestLogger):
     """Test agent status"""
-    print("\n" + "="*60)
-    print("TEST 4: Agent Status")
-    print("="*60)
+    log.log("\n" + "="*60)
+    log.log("TEST 4: Agent Status")
+    log.log("="*60)
     
     agents = [
         ("Orchestrator", orchestrator),
@@ -106,11 +136,11 @@ async def test_agent_status():
     
     for name, agent in agents:
         status = agent.get_status()
-        print(f"\n{name}:")
-        print(f"  ID: {status['agent_id']}")
-        print(f"  Type: {status['agent_type']}")
-        print(f"  Status: {status['status']}")
-        print(f"  Capabilities: {', '.join(status['capabilities'])}")
+        log.log(f"\n{name}:")
+        log.log(f"  ID: {status['agent_id']}")
+        log.log(f"  Type: {status['agent_type']}")
+        log.log(f"  Status: {status['status']}")
+        log.log(f"  Capabilities: {', '.join(status['capabilities'])}")
 
 
 async def run_all_tests():
@@ -119,21 +149,35 @@ async def run_all_tests():
     print("AI TRAVEL ASSISTANT v2.0 - TEST SUITE")
     print("="*60)
     
-    try:
-        await test_flight_search()
-        await test_payment_processing()
-        await test_orchestrator_workflow()
-        await test_agent_status()
-        
+    # The orchestrator workflow waits on replies from the other agents' queues
+    for agent in (orchestrator, flight_agent, payment_agent):
+        agent.start_listening_in_background()
+    
+    tests = [test_flight_search, test_payment_processing, test_orchestrator_workflow, test_agent_status]
+    loggers = [TestLogger() for _ in tests]
+    
+    # The tests are independent, so their agent round trips overlap
+    results = await asyncio.gather(*[test(log) for test, log in zip(tests, loggers)], return_exceptions=True)
+    
+    failures = 0
+    for test, log, result in zip(tests, loggers, results):
+        if isinstance(result, Exception):
+            failures += 1
+            log.log(f"\n✗ TEST FAILED: {test.__name__}: {result}\n")
+            log.log("".join(traceback.format_exception(type(result), result, result.__traceback__)))
+        sys.stdout.write(log.buffer.getvalue())
+    
+    if not failures:
         print("\n" + "="*60)
         print("✓ ALL TESTS PASSED")
         print("="*60 + "\n")
-        
-    except Exception as e:
-        print(f"\n✗ TEST FAILED: {e}\n")
-        import traceback
-        traceback.print_exc()
-
 
 if __name__ == "__main__":
+    # uvloop is optional; fall back to the default event loop when it isn't installed
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     asyncio.run(run_all_tests())
@@ -0,0 +1,36 @@
+"""
+Tests for preference extraction in the chat agent
+"""
+from modules.agent import extract_preferences
+
+
+def test_comparative_and_superlative_budget():
+    assert extract_preferences("show me cheaper hotels")['budget'] == 'low'
+    assert extract_preferences("the cheapest flights please")['budget'] == 'low'
+
+
+def test_comparatives_and_nicknames_combined():
+    assert extract_preferences("cheaper options foodie") == {
+        'budget': 'low',
+        'price_range': '$',
+        'interests': ['food'],
+    }
+
+
+def test_stacked_suffixes():
+    assert extract_preferences("trips for foodies")['interests'] == ['food']
+
+
+def test_plurals_and_gerunds():
+    assert extract_preferences("museums, beaches and relaxing")['interests'] == ['cultural', 'nature', 'relaxation']
+
+
+def test_no_substring_matches_inside_words():
+    # "great" contains "eat" and "space" contains "spa"
+    assert extract_preferences("a great space") == {}
+
+
+def test_adverbs_and_derived_forms():
+    assert extract_preferences("culturally rich, moderately priced")['interests'] == ['cultural']
+    assert extract_preferences("moderately priced")['budget'] == 'moderate'
+    assert extract_preferences("a relaxed photographer")['interests'] == ['relaxation', 'photography']
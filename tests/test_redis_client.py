@@ -0,0 +1,49 @@
+"""
+Tests for the Redis client wrapper
+"""
+from shared.redis_client import RedisClient
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the redis-py calls used by set/get"""
+    
+    def __init__(self):
+        self.store = {}
+    
+    def set(self, key, value):
+        self.store[key] = value
+    
+    def setex(self, key, ttl, value):
+        self.store[key] = value
+    
+    def get(self, key):
+        value = self.store.get(key)
+        # The real client is created with decode_responses=True
+        return value.decode() if isinstance(value, bytes) else value
+
+
+def make_client() -> RedisClient:
+    client = RedisClient()
+    client.client = FakeRedis()
+    return client
+
+
+def test_set_get_round_trip():
+    client = make_client()
+    value = {"budget": "low", "interests": ["food", "beach"], "count": 2}
+    
+    client.set("prefs", value)
+    
+    assert client.get("prefs") == value
+
+
+def test_set_with_ttl_and_non_str_keys():
+    client = make_client()
+    
+    client.set("counts", {1: "one"}, ttl=60)
+    
+    assert client.get("counts") == {"1": "one"}
+
+
+def test_get_missing_key():
+    assert make_client().get("missing") is None